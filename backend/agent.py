@@ -1,25 +1,51 @@
 import asyncio
+import hashlib
 import logging
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAioHttpClient
 from typing import Tuple
 from dotenv import load_dotenv
 import os
 from rapidfuzz import process, fuzz
+from rapidfuzz.distance import Levenshtein
 import json
 import re
+from collections import OrderedDict
 
 load_dotenv()
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Most recent chat_history entries included verbatim in the process_query prompt; ContextManager
+# keeps the same number stored and folds everything older into the rolling summary
+PROMPT_HISTORY_WINDOW = 20
+
+# One AsyncOpenAI client (and connection pool) per process, shared by every Agent instance
+_GLOBAL_OPENAI = None
+
+def _get_openai_client(api_key: str) -> AsyncOpenAI:
+    global _GLOBAL_OPENAI
+    if _GLOBAL_OPENAI is None:
+        # aiohttp-backed transport scales better than the default httpx one under many concurrent sessions
+        _GLOBAL_OPENAI = AsyncOpenAI(
+            api_key=api_key,
+            http_client=DefaultAioHttpClient(
+                timeout=60.0,
+                limits=httpx.Limits(max_connections=200, max_keepalive_connections=50)
+            )
+        )
+    return _GLOBAL_OPENAI
+
 class Agent:
     def __init__(self):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             logger.error("OPENAI_API_KEY not found in .env file")
             raise ValueError("OPENAI_API_KEY environment variable is not set")
-        self.client = AsyncOpenAI(api_key=api_key)
+        self.client = _get_openai_client(api_key)
         logger.info("OpenAI client initialized successfully")
+        # Small/fast model for the short structured calls on the critical path (correction, intent)
+        self.classify_model = os.getenv("CLASSIFY_MODEL", "gpt-4o-mini")
         self.suggested_questions = [
             "What is the salary range for this position?",
             "What are the next steps in the interview process?",
@@ -43,6 +69,11 @@ class Agent:
             "Kuala Lumpur, Malaysia", "Singapore", "Chiswick, UK"
         ]
         self.common_terms = ["restaurants", "restaurant", "pgs", "pg", "nearby", "near", "address", "locations", "offices"]
+        # Fuzzy-match vocabulary for correct_query, scored in a single cdist call
+        self._all_fuzzy_terms = [city.split(",")[0].lower() for city in self.quadrant_cities] + self.common_terms
+        # LRU of corrected queries keyed by (query_lower, role, formatted history window fed to the LLM)
+        self._correction_cache = OrderedDict()
+        self._correction_cache_size = 1024
         
         # Load media URLs from .env
         self.video_url = os.getenv("VIDEO_URL")
@@ -293,21 +324,13 @@ class Agent:
         }
         self.dress_images = {k: v for k, v in self.dress_images.items() if v}
         logger.info(f"Loaded {len(self.dress_images)} dress images")
-    
-    async def correct_query(self, query: str, history: list, role: str) -> str:
-        try:
-            query_lower = query.lower()
-            corrected_query = query_lower
-            for city in self.quadrant_cities:
-                city_lower = city.split(",")[0].lower()
-                match = process.extractOne(city_lower, [query_lower], scorer=fuzz.partial_ratio, score_cutoff=80)
-                if match:
-                    corrected_query = corrected_query.replace(match[0], city_lower)
-            for term in self.common_terms:
-                match = process.extractOne(term, [query_lower], scorer=fuzz.partial_ratio, score_cutoff=80)
-                if match:
-                    corrected_query = corrected_query.replace(match[0], term)
-            prompt = (
+
+        # Static instructions live in the system message so OpenAI's prompt-prefix cache
+        # can hit across calls; only the user turn carries the per-request context.
+        self._query_system_msgs = {role: self._build_query_system_msg(role) for role in ("hr", "candidate")}
+        self._intent_system_msgs = {role: self._build_intent_system_msg(role) for role in ("hr", "candidate")}
+        self._correction_instructions = {
+            role: (
                 "You are an expert at correcting typos and understanding user intent in queries. "
                 f"Based on the conversation history, context (interacting with {'HR' if role == 'hr' else 'candidate'}), "
                 "previous and following words, and the full question, correct any spelling, typing, or grammatical errors. "
@@ -315,12 +338,148 @@ class Agent:
                 f"Known cities: {', '.join(self.quadrant_cities)}. Common terms: {', '.join(self.common_terms)}. "
                 "Output ONLY the corrected query, nothing else."
             )
-            prompt += f"\n\nConversation History:\n"
-            for msg in history:
-                prompt += f"{msg['role'].capitalize()}: {msg['query']}\nAssistant: {msg['response']}\n"
-            prompt += f"\nOriginal Query: {query}\nCorrected Query:"
+            for role in ("hr", "candidate")
+        }
+
+    @staticmethod
+    def _format_history(history: list) -> str:
+        return "".join(
+            f"{msg['role'].capitalize()}: {msg['query']}\nAssistant: {msg['response']}\n" for msg in history
+        )
+
+    @staticmethod
+    def prompt_context_digest(history: list, history_summary: str = None) -> str:
+        # Fingerprint of the conversation context process_query puts into the prompt
+        context = f"{history_summary or ''}\x00{Agent._format_history(history[-PROMPT_HISTORY_WINDOW:])}"
+        return hashlib.sha256(context.encode()).hexdigest()
+
+    def _build_query_system_msg(self, role: str) -> dict:
+        content = (
+            "You are a helpful assistant for analyzing documents with context retention. "
+            "You are an expert assistant analyzing job descriptions and resumes, designed to maintain conversation context like a chat application. "
+            f"You are interacting with a {'HR representative' if role == 'hr' else 'job candidate'}. "
+            "You will be given the extracted text from relevant document sections and the conversation history. "
+            "Answer the user's query based on the document content and prior conversation. "
+            "Provide a concise and accurate response. If the query cannot be answered based on the provided text or history, say so clearly. "
+            "Support follow-up questions and topic switches while maintaining context. "
+            "For queries about the president, best employee, or leadership team, do not mention any photo or link in the response text."
+            "For queries asking for do's and don'ts (e.g., interview tips, dress code, workplace etiquette), structure the response with '#### Do's' and '#### Don'ts' sections containing bullet points starting with a dash (-). Ensure items are unique, concise, properly indented, and avoid duplicates. If applicable, include headers like '## For Male Employees:' or '## For Female Employees:' for dress code, or other relevant headers for the context (e.g., '## Interview Tips'). End with 'If you have any further questions, feel free to ask!'"
+        )
+        if role == "candidate":
+            content += f"\n\nSuggested Questions for Candidate:\n" + "\n".join(f"- {q}" for q in self.suggested_questions)
+        return {"role": "system", "content": content}
+
+    def _build_intent_system_msg(self, role: str) -> dict:
+        content = (
+            "You are a JSON-only responder. Output only a valid JSON object with keys: is_map (bool), intent (string), city (string or null), nearby_type (string or null), origin (string or null), destination (string or null), gender (string or null). No extra text. "
+            "You are an intent classifier for a chat app focused on Quadrant Technologies locations and document-based queries. "
+            f"Analyze the query in the context of interacting with {'HR' if role == 'hr' else 'candidate'}. "
+            "Step 1: Determine if the query is map-related ('map') or not ('non_map'). "
+            "Map-related queries involve locations, addresses, nearby amenities, or directions related to 'Quadrant Technologies'. "
+            "Step 2: If map-related, classify the intent into one of: "
+            "'single_location' (ask for specific office address/city), "
+            "'multi_location' (ask for all offices or multiple cities), "
+            "'nearby' (ask for amenities like PGs/restaurants near an office), "
+            "'directions' (ask for step-by-step directions to/from an office), "
+            "'distance' (ask for distance or travel time to/from an office, e.g., 'how far is airport from Quadrant Hyderabad'). "
+            "Extract entities: city (exact match from known: " + ", ".join(self.quadrant_cities) + "), "
+            "nearby_type (e.g., 'ladies pgs', 'gents pgs', 'restaurants', or infer from query like 'hotels', 'cafes'), "
+            "origin (starting point for directions or distance, e.g., Quadrant office address if not specified), "
+            "destination (endpoint for directions or distance, e.g., 'airport'). "
+            "If city is implied (e.g., 'nearby PGs in Hyderabad' or 'how far is airport from Quadrant Hyderabad' implies Quadrant Hyderabad), use it. "
+            "For 'nearby' and 'directions'/'distance' with no explicit origin, use Quadrant office as the source address. "
+            "For queries containing 'how far' or 'distance', classify as 'distance' intent. "
+            "If not map-related, classify the intent into one of: "
+            "'video' (queries related to videos, company videos,ai capabilities,ai empowered solutions or any video content), "
+            "'dress' (queries related to dress code, what to wear, or clothing policies), "
+            "'president' (queries related to the president, company leadership, or president details), "
+            "'best_employee' (queries related to the best employee, employee of the month, or similar), "
+            "'leadership' (queries about the leadership team, executive team, or company leaders), "
+            "'document' (any other general query to be answered from uploaded documents). "
+            "For 'dress' intent, also extract 'gender': 'male' if the query mentions male/men/gents, 'female' if female/women/ladies, else null. "
+            "Output ONLY a valid JSON object. Examples: "
+            "{'is_map': true, 'intent': 'single_location', 'city': 'Bengaluru, Karnataka', 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
+            "or {'is_map': true, 'intent': 'distance', 'city': 'Hyderabad, Telangana', 'nearby_type': null, 'origin': null, 'destination': 'airport', 'gender': null} "
+            "or {'is_map': false, 'intent': 'video', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
+            "or {'is_map': false, 'intent': 'dress', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': 'male'} "
+            "or {'is_map': false, 'intent': 'president', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
+            "or {'is_map': false, 'intent': 'best_employee', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
+            "or {'is_map': false, 'intent': 'leadership', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
+            "or {'is_map': false, 'intent': 'document', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null}"
+        )
+        return {"role": "system", "content": content}
+    
+    def _fuzzy_correct(self, query_lower: str) -> str:
+        """Replace misspelled known cities/terms in the query with their canonical spelling."""
+        scores = process.cdist(
+            [query_lower], self._all_fuzzy_terms,
+            scorer=fuzz.partial_ratio, score_cutoff=80, workers=-1
+        )[0]
+        candidates = []
+        for term, score in zip(self._all_fuzzy_terms, scores):
+            if score < 80:
+                continue
+            alignment = fuzz.partial_ratio_alignment(term, query_lower, score_cutoff=80)
+            if alignment is None:
+                continue
+            # Snap the aligned window out to whole words so the replacement never splits a token
+            start, end = alignment.dest_start, alignment.dest_end
+            while start < end and query_lower[start].isspace():
+                start += 1
+            while end > start and query_lower[end - 1].isspace():
+                end -= 1
+            while start > 0 and query_lower[start - 1].isalnum():
+                start -= 1
+            while end < len(query_lower) and query_lower[end].isalnum():
+                end += 1
+            span = query_lower[start:end]
+            # Exact hits, inflections ('office' vs 'offices') and embedded words ('near' in 'linear') are not typos
+            if term in span or span in term:
+                continue
+            word_score = fuzz.ratio(term, span)
+            if word_score >= 80:
+                candidates.append((word_score, len(term), start, end, term))
+        # Best-scoring (then longest) term wins each span; apply right to left so offsets stay valid
+        chosen = []
+        for _, _, start, end, term in sorted(candidates, reverse=True):
+            if not any(start < c_end and c_start < end for c_start, c_end, _ in chosen):
+                chosen.append((start, end, term))
+        corrected = query_lower
+        for start, end, term in sorted(chosen, reverse=True):
+            corrected = corrected[:start] + term + corrected[end:]
+        return corrected
+
+    def _cache_correction(self, key: tuple, corrected: str) -> str:
+        self._correction_cache[key] = corrected
+        self._correction_cache.move_to_end(key)
+        if len(self._correction_cache) > self._correction_cache_size:
+            self._correction_cache.popitem(last=False)
+        return corrected
+
+    async def correct_query(self, query: str, history: list, role: str) -> str:
+        query_lower = query.lower()
+        corrected_query = query_lower
+        # The LLM sees the last two turns, so follow-ups like "what about there?" are cached per conversation
+        history_window = self._format_history(history[-2:])
+        cache_key = (query_lower, role, history_window)
+        cached = self._correction_cache.get(cache_key)
+        if cached is not None:
+            self._correction_cache.move_to_end(cache_key)
+            logger.debug(f"Correction cache hit for '{query}'")
+            return cached
+        try:
+            corrected_query = self._fuzzy_correct(query_lower)
+            # Nothing to fix locally and no short, typo-prone tokens: skip the LLM round-trip
+            if corrected_query == query_lower and all(len(t) >= 3 for t in query_lower.split()):
+                logger.debug(f"Skipping LLM correction for '{query}'")
+                return self._cache_correction(cache_key, query)
+            prompt = (
+                f"{self._correction_instructions['hr' if role == 'hr' else 'candidate']}"
+                f"\n\nConversation History:\n{history_window}"
+                f"\nOriginal Query: {query}\nCorrected Query:"
+            )
             response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
+                model=self.classify_model,
                 messages=[
                     {"role": "system", "content": "You are a typo correction and intent understanding assistant."},
                     {"role": "user", "content": prompt}
@@ -330,7 +489,7 @@ class Agent:
             )
             corrected = response.choices[0].message.content.strip()
             logger.info(f"Corrected query: '{query}' -> '{corrected}'")
-            return corrected if corrected else corrected_query
+            return self._cache_correction(cache_key, corrected if corrected else corrected_query)
         except Exception as e:
             logger.error(f"Error correcting query: {e}")
             return corrected_query
@@ -415,7 +574,30 @@ class Agent:
         
         return result
 
-    async def process_query(self, documents: str, history: list, query: str, role: str, intent_data: dict = None) -> Tuple[str, dict | None]:
+    async def summarize_history(self, previous_summary: str | None, history: list) -> str | None:
+        """Fold older chat turns (and any earlier summary) into a short running summary; None if it failed."""
+        prompt = (
+            "Summarize the following conversation between a user and an HR assistant in at most 5 sentences. "
+            "Keep names, locations, and any facts the user may refer back to. Output only the summary."
+            f"\n\nEarlier Summary:\n{previous_summary or 'None'}"
+            f"\n\nConversation:\n{self._format_history(history)}"
+        )
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.classify_model,
+                messages=[
+                    {"role": "system", "content": "You are a concise conversation summarizer."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=200,
+                temperature=0.3
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error(f"Error summarizing history: {e}")
+            return None
+
+    async def process_query(self, documents: str, history: list, query: str, role: str, intent_data: dict = None, history_summary: str = None) -> Tuple[str, dict | None]:
         try:
             # Null-safety for intent_data: Default to empty dict if None
             intent_data = intent_data or {}
@@ -442,10 +624,11 @@ class Agent:
                 
             elif intent == "leadership":
                 # Construct leadership team response in exact order
-                answer = "Here is the leadership team of Quadrant Technologies:\n\n"
-                for member in self.leadership_team:
-                    answer += f"- {member['name']}, {member['title']}\n"
-                answer += "\nIf you have any further questions about the company or its leadership, feel free to ask!"
+                answer = (
+                    "Here is the leadership team of Quadrant Technologies:\n\n"
+                    + "".join(f"- {member['name']}, {member['title']}\n" for member in self.leadership_team)
+                    + "\nIf you have any further questions about the company or its leadership, feel free to ask!"
+                )
                 media_data = {
                     "type": "leadership",
                     "members": [
@@ -459,24 +642,14 @@ class Agent:
                 logger.debug(f"Leadership intent detected with {len(media_data['members'])} members with images")
                 return answer, media_data
 
-            # For all other intents, build the LLM prompt
-            prompt = (
-                "You are an expert assistant analyzing job descriptions and resumes, designed to maintain conversation context like a chat application. "
-                f"You are interacting with a {'HR representative' if role == 'hr' else 'job candidate'}. "
-                "Below is the extracted text from relevant document sections and the conversation history. "
-                "Answer the user's query based on the document content and prior conversation. "
-                "Provide a concise and accurate response. If the query cannot be answered based on the provided text or history, say so clearly. "
-                "Support follow-up questions and topic switches while maintaining context. "
-                "For queries about the president, best employee, or leadership team, do not mention any photo or link in the response text."
-                "For queries asking for do's and don'ts (e.g., interview tips, dress code, workplace etiquette), structure the response with '#### Do's' and '#### Don'ts' sections containing bullet points starting with a dash (-). Ensure items are unique, concise, properly indented, and avoid duplicates. If applicable, include headers like '## For Male Employees:' or '## For Female Employees:' for dress code, or other relevant headers for the context (e.g., '## Interview Tips'). End with 'If you have any further questions, feel free to ask!'"
+            # For all other intents, build the per-request user turn; static instructions are in the system message
+            prompt_parts = [f"Documents:\n{documents}\n\n"]
+            if history_summary:
+                prompt_parts.append(f"Earlier Conversation Summary:\n{history_summary}\n\n")
+            prompt_parts.append(
+                f"Conversation History:\n{self._format_history(history[-PROMPT_HISTORY_WINDOW:])}"
+                f"\n{role.capitalize()} Query: {query}"
             )
-            
-            if role == "candidate":
-                prompt += f"\n\nSuggested Questions for Candidate:\n" + "\n".join(f"- {q}" for q in self.suggested_questions)
-            prompt += f"\n\nDocuments:\n{documents}\n\nConversation History:\n"
-            for msg in history:
-                prompt += f"{msg['role'].capitalize()}: {msg['query']}\nAssistant: {msg['response']}\n"
-            prompt += f"\n{role.capitalize()} Query: {query}"
 
             media_data = None
             gender = intent_data.get("gender")
@@ -484,9 +657,9 @@ class Agent:
             if intent == "dress":
                 if gender:
                     gender_cap = gender.capitalize()
-                    prompt += f"\nIf the query is about dress code for {gender}, structure the response starting with '## For {gender_cap} Employees:' followed by '### Business Formals (Monday–Thursday):', '### Smart Casuals (Friday):', '### Footwear:', '### Hair & Beard:' or '### Hair:', '### Jewelry:' (as applicable) with '#### Do's' and '#### Don'ts' with bullet points for allowed and prohibited categories. Each item must start with a dash (-), be unique, and avoid duplicates. End with 'For more details, you can view the dress code image here. If you have any further questions, feel free to ask!'"
+                    prompt_parts.append(f"\nIf the query is about dress code for {gender}, structure the response starting with '## For {gender_cap} Employees:' followed by '### Business Formals (Monday–Thursday):', '### Smart Casuals (Friday):', '### Footwear:', '### Hair & Beard:' or '### Hair:', '### Jewelry:' (as applicable) with '#### Do's' and '#### Don'ts' with bullet points for allowed and prohibited categories. Each item must start with a dash (-), be unique, and avoid duplicates. End with 'For more details, you can view the dress code image here. If you have any further questions, feel free to ask!'")
                 else:
-                    prompt += "\nIf the query is about dress code, structure the response with two main sections: '## For Male Employees:' and '## For Female Employees:', each followed by '### Business Formals (Monday–Thursday):', '### Smart Casuals (Friday):', '### Footwear:', '### Hair & Beard:' or '### Hair:', '### Jewelry:' (as applicable) with '#### Do's' and '#### Don'ts' with bullet points for allowed and prohibited categories. Each item must start with a dash (-), be unique, and avoid duplicates. End with 'For more details, you can view the dress code image here. If you have any further questions, feel free to ask!'"
+                    prompt_parts.append("\nIf the query is about dress code, structure the response with two main sections: '## For Male Employees:' and '## For Female Employees:', each followed by '### Business Formals (Monday–Thursday):', '### Smart Casuals (Friday):', '### Footwear:', '### Hair & Beard:' or '### Hair:', '### Jewelry:' (as applicable) with '#### Do's' and '#### Don'ts' with bullet points for allowed and prohibited categories. Each item must start with a dash (-), be unique, and avoid duplicates. End with 'For more details, you can view the dress code image here. If you have any further questions, feel free to ask!'")
                 media_data = {"type": "image", "url": self.dress_code_image_url} if self.dress_code_image_url else None
             elif intent == "president":
                 media_data = {"type": "image", "url": self.president_image_url} if self.president_image_url else None
@@ -496,8 +669,8 @@ class Agent:
             response = await self.client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant for analyzing documents with context retention."},
-                    {"role": "user", "content": prompt}
+                    self._query_system_msgs["hr" if role == "hr" else "candidate"],
+                    {"role": "user", "content": "".join(prompt_parts)}
                 ],
                 max_tokens=300,
                 temperature=0.7
@@ -607,66 +780,38 @@ class Agent:
             logger.error(f"Error processing map query: {e}")
             raise
 
-    async def classify_intent_and_extract(self, query: str, history: list, role: str) -> dict:
-        try:
-            corrected_query = await self.correct_query(query, history, role)
-            prompt = (
-                "You are an intent classifier for a chat app focused on Quadrant Technologies locations and document-based queries. "
-                f"Analyze the query in the context of interacting with {'HR' if role == 'hr' else 'candidate'}. "
-                "Step 1: Determine if the query is map-related ('map') or not ('non_map'). "
-                "Map-related queries involve locations, addresses, nearby amenities, or directions related to 'Quadrant Technologies'. "
-                "Step 2: If map-related, classify the intent into one of: "
-                "'single_location' (ask for specific office address/city), "
-                "'multi_location' (ask for all offices or multiple cities), "
-                "'nearby' (ask for amenities like PGs/restaurants near an office), "
-                "'directions' (ask for step-by-step directions to/from an office), "
-                "'distance' (ask for distance or travel time to/from an office, e.g., 'how far is airport from Quadrant Hyderabad'). "
-                "Extract entities: city (exact match from known: " + ", ".join(self.quadrant_cities) + "), "
-                "nearby_type (e.g., 'ladies pgs', 'gents pgs', 'restaurants', or infer from query like 'hotels', 'cafes'), "
-                "origin (starting point for directions or distance, e.g., Quadrant office address if not specified), "
-                "destination (endpoint for directions or distance, e.g., 'airport'). "
-                "If city is implied (e.g., 'nearby PGs in Hyderabad' or 'how far is airport from Quadrant Hyderabad' implies Quadrant Hyderabad), use it. "
-                "For 'nearby' and 'directions'/'distance' with no explicit origin, use Quadrant office as the source address. "
-                "For queries containing 'how far' or 'distance', classify as 'distance' intent. "
-                "If not map-related, classify the intent into one of: "
-                "'video' (queries related to videos, company videos,ai capabilities,ai empowered solutions or any video content), "
-                "'dress' (queries related to dress code, what to wear, or clothing policies), "
-                "'president' (queries related to the president, company leadership, or president details), "
-                "'best_employee' (queries related to the best employee, employee of the month, or similar), "
-                "'leadership' (queries about the leadership team, executive team, or company leaders), "
-                "'document' (any other general query to be answered from uploaded documents). "
-                "For 'dress' intent, also extract 'gender': 'male' if the query mentions male/men/gents, 'female' if female/women/ladies, else null. "
-                "Output ONLY a valid JSON object. Examples: "
-                "{'is_map': true, 'intent': 'single_location', 'city': 'Bengaluru, Karnataka', 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
-                "or {'is_map': true, 'intent': 'distance', 'city': 'Hyderabad, Telangana', 'nearby_type': null, 'origin': null, 'destination': 'airport', 'gender': null} "
-                "or {'is_map': false, 'intent': 'video', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
-                "or {'is_map': false, 'intent': 'dress', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': 'male'} "
-                "or {'is_map': false, 'intent': 'president', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
-                "or {'is_map': false, 'intent': 'best_employee', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
-                "or {'is_map': false, 'intent': 'leadership', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null} "
-                "or {'is_map': false, 'intent': 'document', 'city': null, 'nearby_type': null, 'origin': null, 'destination': null, 'gender': null}"
-            )
-            prompt += f"\n\nConversation History:\n"
-            for msg in history[-5:]:
-                prompt += f"{msg['role'].capitalize()}: {msg['query']}\nAssistant: {msg['response']}\n"
-            prompt += f"\nQuery: {corrected_query}\nJSON Output:"
+    async def _classify(self, corrected_query: str, history: list, role: str) -> dict:
+        prompt = f"Conversation History:\n{self._format_history(history[-5:])}\nQuery: {corrected_query}\nJSON Output:"
 
-            response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a JSON-only responder. Output only a valid JSON object with keys: is_map (bool), intent (string), city (string or null), nearby_type (string or null), origin (string or null), destination (string or null), gender (string or null). No extra text."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=200,
-                temperature=0.1,
-                response_format={"type": "json_object"}
+        response = await self.client.chat.completions.create(
+            model=self.classify_model,
+            messages=[
+                self._intent_system_msgs["hr" if role == "hr" else "candidate"],
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=200,
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        raw_content = response.choices[0].message.content.strip()
+        logger.info(f"Raw GPT response for intent classification: '{raw_content}'")
+
+        intent_data = json.loads(raw_content)
+        logger.info(f"Intent classification for '{corrected_query}': {intent_data}")
+        return intent_data
+
+    async def classify_intent_and_extract(self, query: str, history: list, role: str) -> Tuple[str, dict]:
+        try:
+            # Classify the raw query while the correction runs; only re-classify if the correction
+            # changed more than a couple of characters.
+            corrected_query, intent_data = await asyncio.gather(
+                self.correct_query(query, history, role),
+                self._classify(query, history, role)
             )
-            raw_content = response.choices[0].message.content.strip()
-            logger.info(f"Raw GPT response for intent classification: '{raw_content}'")
-            
-            intent_data = json.loads(raw_content)
-            logger.info(f"Intent classification for '{corrected_query}': {intent_data}")
-            return intent_data
+            if Levenshtein.distance(corrected_query.lower(), query.lower()) > 2:
+                logger.info(f"Re-classifying corrected query: '{query}' -> '{corrected_query}'")
+                intent_data = await self._classify(corrected_query, history, role)
+            return corrected_query, intent_data
         except Exception as e:
             logger.error(f"Error in intent classification: {e}")
-            return {"is_map": False, "intent": "document", "city": None, "nearby_type": None, "origin": None, "destination": None, "gender": None}
\ No newline at end of file
+            return query, {"is_map": False, "intent": "document", "city": None, "nearby_type": None, "origin": None, "destination": None, "gender": None}
\ No newline at end of file
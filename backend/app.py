@@ -2,6 +2,7 @@
 
 import os
 import asyncio
+import logging
 from fastapi import FastAPI, WebSocket
 from dotenv import load_dotenv
 from amazon_transcribe.client import TranscribeStreamingClient
@@ -10,8 +11,15 @@ from amazon_transcribe.model import TranscriptEvent
 
 load_dotenv()
 app = FastAPI()
+logger = logging.getLogger(__name__)
 
 client = TranscribeStreamingClient(region=os.getenv("AWS_REGION"))
+# Small WebSocket frames are coalesced to ~250ms of 16kHz 16-bit PCM before each audio event
+AUDIO_FLUSH_BYTES = 8192
+# Frames waiting to be forwarded to Transcribe; a stalled upstream can't grow memory past this
+AUDIO_QUEUE_SIZE = 64
+# For live captions a dropped frame beats growing lag; otherwise a full queue pauses WebSocket reads
+AUDIO_DROP_OLDEST = os.getenv("TRANSCRIBE_DROP_OLDEST", "false").lower() == "true"
 
 class MyEventHandler(TranscriptResultStreamHandler):
     def __init__(self, output_stream, websocket: WebSocket):
@@ -38,13 +46,45 @@ async def transcribe_audio(websocket: WebSocket):
     handler = MyEventHandler(stream.output_stream, websocket)
     handler_task = asyncio.create_task(handler.handle_events())
 
+    queue = asyncio.Queue(maxsize=AUDIO_QUEUE_SIZE)
+
+    async def forward_audio():
+        send_audio_event = stream.input_stream.send_audio_event
+        buffer = bytearray()
+        finished = False
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    finished = True
+                    break
+                buffer += chunk
+                if len(buffer) >= AUDIO_FLUSH_BYTES:
+                    await send_audio_event(audio_chunk=bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await send_audio_event(audio_chunk=bytes(buffer))
+        except Exception as e:
+            logger.error(f"Transcribe stream failed: {e}")
+            # Keep draining until the reader stops so it never blocks on a full queue
+            while not finished:
+                finished = await queue.get() is None
+        finally:
+            await stream.input_stream.end_stream()
+
+    forward_task = asyncio.create_task(forward_audio())
+
     try:
         while True:
             data = await websocket.receive_bytes()
-            await stream.input_stream.send_audio_event(audio_chunk=data)
+            if AUDIO_DROP_OLDEST and queue.full():
+                queue.get_nowait()
+            await queue.put(data)
     except Exception as e:
-        print("WebSocket closed:", e)
+        logger.info(f"WebSocket closed: {e}")
     finally:
-        await stream.input_stream.end_stream()
+        if not forward_task.done():
+            await queue.put(None)
+        await forward_task
         await handler_task
         await websocket.close()
\ No newline at end of file
@@ -1,16 +1,22 @@
 import uuid
 import asyncio
 import logging
-from typing import Dict, List, Tuple
+from typing import AsyncIterable, Dict, List, Tuple, Union
+from collections import OrderedDict
 from motor.motor_asyncio import AsyncIOMotorClient
 from qdrant_client import AsyncQdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client.http.models import (
+    Distance, VectorParams, PointStruct, ScalarQuantization, ScalarQuantizationConfig,
+    ScalarType, SearchParams, QuantizationSearchParams, PayloadSchemaType, Filter,
+    FieldCondition, MatchValue, FilterSelector, Range
+)
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 import os
 import time
+import numpy as np
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from agent import Agent
+from agent import Agent, PROMPT_HISTORY_WINDOW
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -19,16 +25,206 @@ logging.getLogger("pymongo").setLevel(logging.WARNING)
 logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+def uuid4_batch(n: int) -> List[str]:
+    # One urandom read for the whole batch instead of one per uuid.uuid4() call
+    raw = os.urandom(16 * n)
+    return [str(uuid.UUID(bytes=raw[i:i + 16], version=4)) for i in range(0, 16 * n, 16)]
+
+def _load_embedder() -> SentenceTransformer:
+    # int8-quantized ONNX export of MiniLM (same 384-dim normalized output, VNNI int8 matmuls on CPU)
+    onnx_file = os.getenv("EMBEDDER_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+    if onnx_file:
+        try:
+            embedder = SentenceTransformer(
+                "all-MiniLM-L6-v2",
+                backend="onnx",
+                model_kwargs={"file_name": onnx_file, "provider": "CPUExecutionProvider"}
+            )
+            logger.info(f"Loaded ONNX embedder from {onnx_file}")
+            return embedder
+        except Exception as e:
+            logger.warning(f"Failed to load ONNX embedder {onnx_file}, falling back to PyTorch: {str(e)}")
+    return SentenceTransformer("all-MiniLM-L6-v2")
+
+# Loaded once per worker process at import and shared by every ContextManager
+_GLOBAL_EMBEDDER = _load_embedder()
+
 class ContextManager:
-    def __init__(self):
+    def __init__(self, embedder: SentenceTransformer = None, agent: Agent = None):
         mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
         self.mongo_client = AsyncIOMotorClient(mongodb_uri)
         self.db = self.mongo_client["document_analysis"]
+        # Sessions live in per-session collections, so share tokens get their own indexed lookup table
+        self.share_tokens = self.db["share_tokens"]
         qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
         self.qdrant_client = AsyncQdrantClient(qdrant_url)
-        self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
+        # All sessions share one Qdrant collection, partitioned by an indexed session_id payload
+        self.qdrant_collection = os.getenv("QDRANT_COLLECTION", "docs")
+        # Cross-session semantic cache of answers that did not depend on any uploaded document
+        self.response_cache_collection = os.getenv("QDRANT_RESPONSE_CACHE_COLLECTION", "response_cache")
+        self.response_cache_threshold = 0.95
+        self.response_cache_ttl = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+        self._ready_collections = set()
+        self._qdrant_collection_lock = asyncio.Lock()
+        self.embedder = embedder or _GLOBAL_EMBEDDER
+        # Long-lived agent so its OpenAI connection pool survives across queries; main.py passes in its own
+        self.agent = agent or Agent()
+        # Query embeddings are micro-batched; the queue/worker start lazily on the first query
+        # because this object is built at import time, before the event loop runs.
+        self._embed_queue = None
+        self._embed_worker_task = None
+        self._embed_batch_size = 32
+        self._embed_max_wait = 0.005
+        self._background_tasks = set()
+        # Chat history is trimmed to history_limit entries; once history_summary_batch extra entries
+        # pile up, the overflow is folded into a rolling summary instead of being dropped. The limit
+        # matches the prompt window so every entry is either shown to the model or summarized.
+        self.history_limit = PROMPT_HISTORY_WINDOW
+        self.history_summary_batch = 10
+        # session_id -> cached_at for sessions known to exist; lets hot endpoints skip a Mongo lookup
+        self._known_sessions: "OrderedDict[str, float]" = OrderedDict()
+        self.session_cache_ttl = int(os.getenv("SESSION_EXISTS_CACHE_TTL", "300"))
+        self.session_cache_max_size = 10000
         logger.info("ContextManager initialized with MongoDB and Qdrant")
 
+    def _run_in_background(self, coro, description: str):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+
+        def _done(t):
+            self._background_tasks.discard(t)
+            if not t.cancelled() and t.exception():
+                logger.error(f"Background {description} failed: {t.exception()}")
+        task.add_done_callback(_done)
+        return task
+
+    async def ensure_indexes(self):
+        await self.share_tokens.create_index("share_token", unique=True)
+        await self.share_tokens.create_index("session_id")
+
+    async def warmup(self):
+        """Run one throwaway encode so the first real query doesn't pay kernel/session init."""
+        await asyncio.to_thread(self.embedder.encode, ["warmup"], convert_to_numpy=True)
+        logger.info("Embedder warm-up complete")
+
+    async def warmup_connections(self):
+        """Open the Mongo and Qdrant connections (and create the shared collection) before the first request."""
+        await asyncio.gather(self.db.command("ping"), self._ensure_qdrant_collection())
+        logger.info("MongoDB and Qdrant connections warmed up")
+
+    async def drain_background_tasks(self):
+        if self._background_tasks:
+            logger.info(f"Waiting for {len(self._background_tasks)} background tasks")
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+    async def _submit_embed(self, text: str):
+        if self._embed_worker_task is None or self._embed_worker_task.done():
+            self._embed_queue = asyncio.Queue()
+            self._embed_worker_task = asyncio.create_task(self._embed_worker())
+        future = asyncio.get_running_loop().create_future()
+        await self._embed_queue.put((text, future))
+        return await future
+
+    async def _embed_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._embed_queue.get()]
+            deadline = loop.time() + self._embed_max_wait
+            while len(batch) < self._embed_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._embed_queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                vectors = await asyncio.to_thread(
+                    self.embedder.encode,
+                    [text for text, _ in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True
+                )
+                for (_, future), vector in zip(batch, vectors):
+                    if not future.done():
+                        future.set_result(vector)
+                logger.debug(f"Embedded batch of {len(batch)} queries")
+            except Exception as e:
+                logger.error(f"Error embedding batch of {len(batch)} queries: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _ensure_qdrant_collection(self, collection_name: str = None, payload_indexes: Dict = None):
+        collection_name = collection_name or self.qdrant_collection
+        if payload_indexes is None:
+            payload_indexes = {"session_id": PayloadSchemaType.KEYWORD}
+        if collection_name in self._ready_collections:
+            return
+        async with self._qdrant_collection_lock:
+            if collection_name in self._ready_collections:
+                return
+            if not await self.qdrant_client.collection_exists(collection_name):
+                await self.qdrant_client.create_collection(
+                    collection_name=collection_name,
+                    vectors_config=VectorParams(size=384, distance=Distance.COSINE, on_disk=True),
+                    quantization_config=ScalarQuantization(
+                        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+                    )
+                )
+                for field_name, field_schema in payload_indexes.items():
+                    await self.qdrant_client.create_payload_index(
+                        collection_name=collection_name,
+                        field_name=field_name,
+                        field_schema=field_schema
+                    )
+                logger.info(f"Created shared Qdrant collection {collection_name}")
+            self._ready_collections.add(collection_name)
+
+    async def _ensure_response_cache(self):
+        await self._ensure_qdrant_collection(
+            self.response_cache_collection,
+            {"role": PayloadSchemaType.KEYWORD, "context_digest": PayloadSchemaType.KEYWORD, "expires_at": PayloadSchemaType.FLOAT}
+        )
+
+    async def _lookup_cached_response(self, query_embedding, role: str, context_digest: str):
+        await self._ensure_response_cache()
+        hits = (await self.qdrant_client.query_points(
+            collection_name=self.response_cache_collection,
+            query=query_embedding,
+            query_filter=Filter(must=[
+                FieldCondition(key="role", match=MatchValue(value=role)),
+                FieldCondition(key="context_digest", match=MatchValue(value=context_digest)),
+                FieldCondition(key="expires_at", range=Range(gt=time.time()))
+            ]),
+            limit=1,
+            score_threshold=self.response_cache_threshold,
+            with_payload=True
+        )).points
+        return hits[0].payload if hits else None
+
+    async def _store_cached_response(self, query_embedding, role: str, context_digest: str, query: str, response: str, media_data: dict | None):
+        await self._ensure_response_cache()
+        await self.qdrant_client.upsert(
+            collection_name=self.response_cache_collection,
+            points=[PointStruct(
+                id=str(uuid.uuid4()),
+                vector=query_embedding.tolist(),
+                payload={
+                    "role": role,
+                    "context_digest": context_digest,
+                    "query": query,
+                    "response": response,
+                    "media_data": media_data,
+                    "expires_at": time.time() + self.response_cache_ttl
+                }
+            )],
+            wait=False
+        )
+
+    def _session_filter(self, session_id: str) -> Filter:
+        return Filter(must=[FieldCondition(key="session_id", match=MatchValue(value=session_id))])
+
     async def create_session(self, session_id: str, candidate_name: str, candidate_email: str, share_token: str):
         try:
             collection_name = f"sessions_{session_id}"
@@ -64,15 +260,12 @@ class ContextManager:
                 "created_at": time.time(),
                 "updated_at": time.time()
             }
-            await doc_collection.insert_one(session_data)
-            logger.info(f"Created new session in MongoDB: {session_id} for {candidate_name}")
-
-            qdrant_collection = f"docs_{session_id}"
-            await self.qdrant_client.recreate_collection(
-                collection_name=qdrant_collection,
-                vectors_config=VectorParams(size=384, distance=Distance.COSINE)
+            await asyncio.gather(
+                doc_collection.insert_one(session_data),
+                self.share_tokens.insert_one({"share_token": share_token, "session_id": session_id})
             )
-            logger.info(f"Created Qdrant collection for session {session_id}")
+            self._remember_session(session_id)
+            logger.info(f"Created new session in MongoDB: {session_id} for {candidate_name}")
         except Exception as e:
             logger.error(f"Error creating session {session_id}: {str(e)}")
             raise
@@ -81,13 +274,7 @@ class ContextManager:
         try:
             collection_name = f"sessions_{session_id}"
             doc_collection = self.db[collection_name]
-            session_data = await doc_collection.find_one({"session_id": session_id})
-            if not session_data:
-                logger.error(f"Session {session_id} not found")
-                raise ValueError(f"Session {session_id} not found")
-
-            history = session_data.get("chat_history", [])
-            history.append({
+            entry = {
                 "role": "hr",
                 "query": message,
                 "response": "",
@@ -96,12 +283,18 @@ class ContextManager:
                 "audio_base64": None,
                 "map_data": None,
                 "media_data": None
-            })
+            }
 
             result = await doc_collection.update_one(
                 {"session_id": session_id},
-                {"$set": {"chat_history": history, "initial_message_sent": True, "updated_at": time.time()}}
+                {
+                    "$push": {"chat_history": entry},
+                    "$set": {"initial_message_sent": True, "updated_at": time.time()}
+                }
             )
+            if result.matched_count == 0:
+                logger.error(f"Session {session_id} not found")
+                raise ValueError(f"Session {session_id} not found")
             if result.modified_count == 0:
                 logger.warning(f"No documents updated for session {session_id}")
             logger.info(f"Added initial message to session {session_id} and set flag")
@@ -109,6 +302,28 @@ class ContextManager:
             logger.error(f"Error adding initial message for {session_id}: {str(e)}")
             raise
 
+    def _remember_session(self, session_id: str):
+        self._known_sessions[session_id] = time.monotonic()
+        self._known_sessions.move_to_end(session_id)
+        if len(self._known_sessions) > self.session_cache_max_size:
+            self._known_sessions.popitem(last=False)
+
+    async def session_exists(self, session_id: str) -> bool:
+        try:
+            cached_at = self._known_sessions.get(session_id)
+            if cached_at is not None and time.monotonic() - cached_at < self.session_cache_ttl:
+                self._known_sessions.move_to_end(session_id)
+                return True
+            found = await self.db[f"sessions_{session_id}"].find_one({"session_id": session_id}, {"_id": 1})
+            if found:
+                self._remember_session(session_id)
+                return True
+            self._known_sessions.pop(session_id, None)
+            return False
+        except Exception as e:
+            logger.error(f"Error checking session {session_id}: {str(e)}")
+            raise
+
     async def get_session(self, session_id: str):
         try:
             collection_name = f"sessions_{session_id}"
@@ -150,6 +365,11 @@ class ContextManager:
 
     async def validate_token(self, token: str) -> str:
         try:
+            entry = await self.share_tokens.find_one({"share_token": token})
+            if entry:
+                return entry["session_id"]
+
+            # Sessions created before the share_tokens table existed are found by scanning, then backfilled
             collections = await self.db.list_collection_names()
             session_collections = [coll for coll in collections if coll.startswith("sessions_")]
             
@@ -158,6 +378,11 @@ class ContextManager:
                 session = await doc_collection.find_one({"share_token": token})
                 if session:
                     logger.info(f"Found session with token {token} in collection {collection_name}")
+                    await self.share_tokens.update_one(
+                        {"share_token": token},
+                        {"$set": {"session_id": session["session_id"]}},
+                        upsert=True
+                    )
                     return session["session_id"]
             
             logger.warning(f"No session found with token {token}")
@@ -179,96 +404,103 @@ class ContextManager:
                 logger.debug("Empty text provided, returning single empty chunk")
                 return [""]
 
-            lines = text.split("\n")
-            lines = [line.strip() for line in lines if line.strip()]
+            lines = [stripped for stripped in (line.strip() for line in text.split("\n")) if stripped]
+            # Greedy packing via cumulative word counts: each chunk ends at the last line that keeps
+            # it within max_chunk_size words (a single oversized line becomes its own chunk).
+            word_counts = np.fromiter((len(line.split()) for line in lines), dtype=np.int64, count=len(lines))
+            cumulative = np.cumsum(word_counts)
             chunks = []
-            current_chunk = []
-            current_words = 0
-            for line in lines:
-                word_count = len(line.split())
-                if current_words + word_count <= max_chunk_size:
-                    current_chunk.append(line)
-                    current_words += word_count
-                else:
-                    if current_chunk:
-                        chunks.append("\n".join(current_chunk))
-                    current_chunk = [line]
-                    current_words = word_count
-            if current_chunk:
-                chunks.append("\n".join(current_chunk))
+            start = 0
+            while start < len(lines):
+                base = cumulative[start - 1] if start else 0
+                end = int(np.searchsorted(cumulative, base + max_chunk_size, side="right"))
+                end = max(end, start + 1)
+                chunks.append("\n".join(lines[start:end]))
+                start = end
             logger.info(f"Created {len(chunks)} chunks from text")
             return chunks
         except Exception as e:
             logger.error(f"Error chunking text: {e}")
             raise
 
-    async def store_session_data(self, session_id: str, extracted_text: Dict[str, str]):
+    def _sanitize_text(self, filename: str, text) -> str:
+        if isinstance(text, list):
+            logger.warning(f"Converting list to string for filename {filename}: {text}")
+            return " ".join(str(item) for item in text if item)
+        if isinstance(text, str):
+            return text
+        logger.warning(f"Invalid text type for filename {filename}: {type(text)}. Using empty string.")
+        return ""
+
+    async def _embed_file_chunks(self, session_id: str, filename: str, text: str) -> List[PointStruct]:
+        # Empty files are only recorded in MongoDB; zero-vector placeholders never match a query
+        chunks = [chunk for chunk in self.chunk_text(text) if chunk.strip()]
+        if not chunks:
+            return []
+        embeddings = await asyncio.to_thread(
+            self.embedder.encode,
+            chunks,
+            batch_size=64,
+            convert_to_numpy=True
+        )
+        return [
+            PointStruct(
+                id=point_id,
+                vector=embedding,
+                payload={"filename": filename, "chunk": chunk, "session_id": session_id}
+            )
+            # One bulk tolist() on the matrix; PointStruct validates vectors as float lists
+            for point_id, chunk, embedding in zip(uuid4_batch(len(chunks)), chunks, embeddings.tolist())
+        ]
+
+    async def store_session_data(self, session_id: str, extracted_text: Union[Dict[str, str], AsyncIterable[Tuple[str, str]]]) -> Dict[str, str]:
         try:
             collection_name = f"sessions_{session_id}"
             doc_collection = self.db[collection_name]
 
+            # Accepts either a finished dict or a stream of (filename, text) as files finish extracting;
+            # each file is embedded as soon as it arrives so embedding overlaps the remaining extraction
             sanitized_extracted_text = {}
-            for filename, text in extracted_text.items():
-                if isinstance(text, list):
-                    logger.warning(f"Converting list to string for filename {filename}: {text}")
-                    sanitized_extracted_text[filename] = " ".join(str(item) for item in text if item)
-                elif isinstance(text, str):
-                    sanitized_extracted_text[filename] = text
-                else:
-                    logger.warning(f"Invalid text type for filename {filename}: {type(text)}. Using empty string.")
-                    sanitized_extracted_text[filename] = ""
+            points = []
+            if isinstance(extracted_text, dict):
+                async def _iter_items():
+                    for item in extracted_text.items():
+                        yield item
+                items = _iter_items()
+            else:
+                items = extracted_text
+            async for filename, text in items:
+                text = self._sanitize_text(filename, text)
+                sanitized_extracted_text[filename] = text
+                points.extend(await self._embed_file_chunks(session_id, filename, text))
 
             await doc_collection.update_one(
                 {"session_id": session_id},
                 {"$set": {"extracted_text": sanitized_extracted_text, "updated_at": time.time()}}
             )
             logger.info(f"Stored/updated extracted text in MongoDB for session: {session_id}")
-
-            qdrant_collection = f"docs_{session_id}"
-            points = []
-            point_id = 1
-            all_chunks = []
-            chunk_metadata = []
-            for filename, text in sanitized_extracted_text.items():
-                chunks = self.chunk_text(text)
-                all_chunks.extend(chunks)
-                chunk_metadata.extend([(filename, chunk) for chunk in chunks])
-
-            if all_chunks and any(chunk.strip() for chunk in all_chunks):
-                embeddings = self.embedder.encode(
-                    [chunk for chunk in all_chunks if chunk.strip()],
-                    batch_size=32,
-                    convert_to_numpy=True
-                )
-                embedding_index = 0
-                for (filename, chunk) in chunk_metadata:
-                    if chunk.strip():
-                        points.append(PointStruct(
-                            id=point_id,
-                            vector=embeddings[embedding_index].tolist(),
-                            payload={"filename": filename, "chunk": chunk, "session_id": session_id}
-                        ))
-                        embedding_index += 1
-                    else:
-                        points.append(PointStruct(
-                            id=point_id,
-                            vector=[0.0] * 384,
-                            payload={"filename": filename, "chunk": "", "session_id": session_id}
-                        ))
-                    point_id += 1
-            else:
-                logger.info(f"No non-empty chunks to embed for session {session_id}, storing empty data")
-                for filename in sanitized_extracted_text.keys():
-                    points.append(PointStruct(
-                        id=point_id,
-                        vector=[0.0] * 384,
-                        payload={"filename": filename, "chunk": "", "session_id": session_id}
-                    ))
-                    point_id += 1
-
+            if not points:
+                logger.info(f"No non-empty chunks to embed for session {session_id}, skipping Qdrant upsert")
+
+            await self._ensure_qdrant_collection()
+            # Replace the session's previous chunks, mirroring the $set on extracted_text above
+            await self.qdrant_client.delete(
+                collection_name=self.qdrant_collection,
+                points_selector=FilterSelector(filter=self._session_filter(session_id))
+            )
             if points:
-                await self.qdrant_client.upsert(collection_name=qdrant_collection, points=points)
+                # Fire fixed-size batches without waiting for indexing so Qdrant can pipeline them
+                batch_size = 256
+                await asyncio.gather(*(
+                    self.qdrant_client.upsert(
+                        collection_name=self.qdrant_collection,
+                        points=points[i:i + batch_size],
+                        wait=False
+                    )
+                    for i in range(0, len(points), batch_size)
+                ))
                 logger.info(f"Stored {len(points)} embeddings in Qdrant for session {session_id}")
+            return sanitized_extracted_text
 
         except Exception as e:
             logger.error(f"Error storing session data for {session_id}: {str(e)}")
@@ -286,21 +518,27 @@ class ContextManager:
         try:
             collection_name = f"sessions_{session_id}"
             doc_collection = self.db[collection_name]
-            session_data = await doc_collection.find_one({"session_id": session_id})
+            # Session lookup and query embedding are independent; run them concurrently
+            session_data, query_embedding = await asyncio.gather(
+                doc_collection.find_one({"session_id": session_id}),
+                self._submit_embed(query)
+            )
             if not session_data:
                 raise ValueError(f"Session {session_id} not found")
 
             history = session_data.get("chat_history", [])
             logger.info(f"Before processing query, history length: {len(history)}, last 2 entries: {history[-2:]}")
 
-            query_embedding = self.embedder.encode(query, convert_to_numpy=True).tolist()
-
-            qdrant_collection = f"docs_{session_id}"
-            search_result = await self.qdrant_client.search(
-                collection_name=qdrant_collection,
-                query_vector=query_embedding,
-                limit=3
-            )
+            await self._ensure_qdrant_collection()
+            search_result = (await self.qdrant_client.query_points(
+                collection_name=self.qdrant_collection,
+                query=query_embedding,
+                query_filter=self._session_filter(session_id),
+                limit=3,
+                search_params=SearchParams(
+                    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+                )
+            )).points
 
             documents = "\n\n".join(
                 f"File: {hit.payload['filename']}\nChunk: {hit.payload['chunk']}"
@@ -308,50 +546,76 @@ class ContextManager:
             )
             logger.info(f"Retrieved {len(search_result)} relevant chunks for session {session_id}")
 
-            agent = Agent()
-            try:
-                response, media_data = await asyncio.wait_for(
-                    agent.process_query(documents, history, query, role, intent_data),
-                    timeout=30.0
-                )
-            except asyncio.TimeoutError:
-                logger.error(f"Timeout while processing query for session {session_id}")
-                raise Exception("Agent processing timed out")
-            except Exception as e:
-                logger.error(f"Agent processing error for session {session_id}: {str(e)}")
-                raise
-
-            # Append user query
-            history.append({
-                "role": role,
-                "query": query,
-                "response": "",
-                "timestamp": time.time(),
-                "intent_data": intent_data,
-                "audio_base64": None,
-                "map_data": None,
-                "media_data": None
-            })
-            # Append assistant response
-            history.append({
-                "role": "assistant",
-                "query": "",
-                "response": response,
-                "timestamp": time.time(),
-                "intent_data": intent_data,
-                "audio_base64": None,
-                "map_data": None,
-                "media_data": media_data
-            })
-
-            # Keep last 20 entries to avoid truncating recent user queries
-            await doc_collection.update_one(
-                {"session_id": session_id},
-                {"$set": {"chat_history": history[-20:], "updated_at": time.time()}}
+            # Only answers that used no session documents are shared, and only between sessions whose
+            # prompt history and summary are identical, since both feed into the answer. The
+            # video/best_employee/leadership intents are answered without an LLM call anyway.
+            cacheable = not search_result and (intent_data or {}).get("intent") not in ("video", "best_employee", "leadership")
+            cached = None
+            if cacheable:
+                context_digest = Agent.prompt_context_digest(history, session_data.get("history_summary"))
+                try:
+                    cached = await self._lookup_cached_response(query_embedding, role, context_digest)
+                except Exception as e:
+                    logger.warning(f"Response cache lookup failed for session {session_id}: {str(e)}")
+
+            if cached:
+                response, media_data = cached["response"], cached.get("media_data")
+                logger.info(f"Response cache hit for session {session_id}: '{query}' ~ '{cached['query']}'")
+            else:
+                try:
+                    response, media_data = await asyncio.wait_for(
+                        self.agent.process_query(
+                            documents, history, query, role, intent_data,
+                            history_summary=session_data.get("history_summary")
+                        ),
+                        timeout=30.0
+                    )
+                except asyncio.TimeoutError:
+                    logger.error(f"Timeout while processing query for session {session_id}")
+                    raise Exception("Agent processing timed out")
+                except Exception as e:
+                    logger.error(f"Agent processing error for session {session_id}: {str(e)}")
+                    raise
+                if cacheable:
+                    self._run_in_background(
+                        self._store_cached_response(query_embedding, role, context_digest, query, response, media_data),
+                        f"response cache store for session {session_id}"
+                    )
+
+            new_entries = [
+                # User query
+                {
+                    "role": role,
+                    "query": query,
+                    "response": "",
+                    "timestamp": time.time(),
+                    "intent_data": intent_data,
+                    "audio_base64": None,
+                    "map_data": None,
+                    "media_data": None
+                },
+                # Assistant response
+                {
+                    "role": "assistant",
+                    "query": "",
+                    "response": response,
+                    "timestamp": time.time(),
+                    "intent_data": intent_data,
+                    "audio_base64": None,
+                    "map_data": None,
+                    "media_data": media_data
+                }
+            ]
+            history.extend(new_entries)
+
+            # Keep the last history_limit entries; the write is off the response path
+            self._run_in_background(
+                self._persist_history(doc_collection, session_id, history, new_entries, session_data.get("history_summary")),
+                f"chat history update for session {session_id}"
             )
-            logger.info(f"Updated chat history for session {session_id}, new history length: {len(history[-20:])}, last 2 entries: {history[-2:]}")
+            logger.info(f"Updated chat history for session {session_id}, new history length: {len(history[-self.history_limit:])}, last 2 entries: {history[-2:]}")
 
-            return response, media_data, history[-20:]
+            return response, media_data, history[-self.history_limit:]
 
         except Exception as e:
             logger.error(f"Error processing query for session {session_id}: {str(e)}")
@@ -368,53 +632,105 @@ class ContextManager:
             history = session_data.get("chat_history", [])
             logger.info(f"Before processing map query, history length: {len(history)}, last 2 entries: {history[-2:]}")
 
-            agent = Agent()
-            response = await agent.process_map_query(map_data, query, role)
+            response = await self.agent.process_map_query(map_data, query, role)
 
-            # Append user query
-            history.append({
-                "role": role,
-                "query": query,
-                "response": "",
-                "timestamp": time.time(),
-                "map_data": map_data,
-                "intent_data": intent_data,
-                "audio_base64": None,
-                "media_data": None
-            })
-            # Append assistant response
-            history.append({
-                "role": "assistant",
-                "query": "",
-                "response": response,
-                "timestamp": time.time(),
-                "map_data": map_data,
-                "intent_data": intent_data,
-                "audio_base64": None,
-                "media_data": None
-            })
+            new_entries = [
+                # User query
+                {
+                    "role": role,
+                    "query": query,
+                    "response": "",
+                    "timestamp": time.time(),
+                    "map_data": map_data,
+                    "intent_data": intent_data,
+                    "audio_base64": None,
+                    "media_data": None
+                },
+                # Assistant response
+                {
+                    "role": "assistant",
+                    "query": "",
+                    "response": response,
+                    "timestamp": time.time(),
+                    "map_data": map_data,
+                    "intent_data": intent_data,
+                    "audio_base64": None,
+                    "media_data": None
+                }
+            ]
+            history.extend(new_entries)
 
-            # Keep last 20 entries to avoid truncating recent user queries
-            await doc_collection.update_one(
-                {"session_id": session_id},
-                {"$set": {"chat_history": history[-20:], "updated_at": time.time()}}
-            )
-            logger.info(f"Updated chat history with map query for session {session_id}, new history length: {len(history[-20:])}, last 2 entries: {history[-2:]}")
+            # Same summarize-then-trim as process_query so map turns don't silently drop context
+            await self._persist_history(doc_collection, session_id, history, new_entries, session_data.get("history_summary"))
+            logger.info(f"Updated chat history with map query for session {session_id}, new history length: {len(history[-self.history_limit:])}, last 2 entries: {history[-2:]}")
 
-            return response, history[-20:]
+            return response, history[-self.history_limit:]
         except Exception as e:
             logger.error(f"Error processing map query for session {session_id}: {str(e)}")
             raise
 
+    async def append_history(self, session_id: str, new_entries: List[Dict], session_data: Dict = None) -> List[Dict]:
+        try:
+            doc_collection = self.db[f"sessions_{session_id}"]
+            if session_data is None:
+                session_data = await doc_collection.find_one(
+                    {"session_id": session_id}, {"chat_history": 1, "history_summary": 1}
+                )
+                if not session_data:
+                    raise ValueError(f"Session {session_id} not found")
+            history = session_data.get("chat_history", []) + new_entries
+            await self._persist_history(doc_collection, session_id, history, new_entries, session_data.get("history_summary"))
+            return history[-self.history_limit:]
+        except Exception as e:
+            logger.error(f"Error appending chat history for session {session_id}: {str(e)}")
+            raise
+
+    async def _persist_history(self, doc_collection, session_id: str, history: List[Dict], new_entries: List[Dict], history_summary: str | None):
+        # Append right away so turns land in order even while an earlier summary is being generated
+        await doc_collection.update_one(
+            {"session_id": session_id},
+            {"$push": {"chat_history": {"$each": new_entries}}, "$set": {"updated_at": time.time()}}
+        )
+        if len(history) >= self.history_limit + self.history_summary_batch:
+            # The summary is an LLM call; keep it off the request path of every caller
+            self._run_in_background(
+                self._summarize_overflow(doc_collection, session_id, history[:-self.history_limit], history_summary),
+                f"history summarization for session {session_id}"
+            )
+
+    async def _summarize_overflow(self, doc_collection, session_id: str, overflow: List[Dict], history_summary: str | None):
+        summary = await self.agent.summarize_history(history_summary, overflow)
+        if summary is None:
+            logger.warning(f"Summarization failed for session {session_id}; keeping {len(overflow)} older history entries")
+            return
+        # Drop exactly the summarized head of the array. Matching on the summary we started from means a
+        # concurrent summarization (which would already have trimmed the head) makes this a no-op.
+        result = await doc_collection.update_one(
+            {"session_id": session_id, "history_summary": history_summary},
+            [{"$set": {
+                "history_summary": summary,
+                "chat_history": {"$slice": ["$chat_history", len(overflow), {"$max": [{"$size": "$chat_history"}, 1]}]}
+            }}]
+        )
+        if result.modified_count:
+            logger.info(f"Summarized {len(overflow)} older history entries for session {session_id}")
+        else:
+            logger.info(f"History for session {session_id} was summarized concurrently; skipping trim")
+
     async def clear_session(self, session_id: str):
         try:
             collection_name = f"sessions_{session_id}"
+            self._known_sessions.pop(session_id, None)
             await self.db.drop_collection(collection_name)
+            await self.share_tokens.delete_many({"session_id": session_id})
             logger.info(f"Cleared MongoDB collection for session {session_id}")
 
-            qdrant_collection = f"docs_{session_id}"
-            await self.qdrant_client.delete_collection(qdrant_collection)
-            logger.info(f"Cleared Qdrant collection for session {session_id}")
+            await self._ensure_qdrant_collection()
+            await self.qdrant_client.delete(
+                collection_name=self.qdrant_collection,
+                points_selector=FilterSelector(filter=self._session_filter(session_id))
+            )
+            logger.info(f"Cleared Qdrant points for session {session_id}")
         except Exception as e:
             logger.error(f"Error clearing session {session_id}: {e}")
             raise
\ No newline at end of file
@@ -5,8 +5,8 @@ from fastapi import HTTPException, Request
 from fastapi.responses import RedirectResponse
 from msal import ConfidentialClientApplication
 import requests
-from datetime import datetime, timedelta
-from pymongo import MongoClient
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -33,7 +33,7 @@ class LoginHandler:
 
         # Initialize MongoDB client
         try:
-            self.mongo_client = MongoClient("mongodb://localhost:27017")
+            self.mongo_client = AsyncIOMotorClient("mongodb://localhost:27017")
             self.db = self.mongo_client["document_analysis"]
             self.users_collection = self.db["users"]
             self.sessions_collection = self.db["sessions"]
@@ -111,11 +111,11 @@ class LoginHandler:
 
             # Generate session ID
             session_id = str(uuid.uuid4())
-            expires_at = datetime.utcnow() + timedelta(hours=1)
+            expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
 
             # Store or update user in MongoDB
             try:
-                self.users_collection.update_one(
+                await self.users_collection.update_one(
                     {"user_id": user_id},
                     {
                         "$set": {
@@ -129,7 +129,7 @@ class LoginHandler:
                             "surname": user_data.get("surname"),
                             "job_title": user_data.get("jobTitle"),
                             "office_location": user_data.get("officeLocation"),
-                            "last_login": datetime.utcnow()
+                            "last_login": datetime.now(timezone.utc)
                         }
                     },
                     upsert=True
@@ -141,14 +141,14 @@ class LoginHandler:
 
             # Store session in MongoDB
             try:
-                self.sessions_collection.insert_one({
+                await self.sessions_collection.insert_one({
                     "session_id": session_id,
                     "user_id": user_id,
                     "email": email,
                     "access_token": access_token,
                     "refresh_token": result.get("refresh_token"),
                     "expires_at": expires_at,
-                    "created_at": datetime.utcnow()
+                    "created_at": datetime.now(timezone.utc)
                 })
                 logger.info(f"Created session {session_id} for user {email}")
             except Exception as e:
@@ -4,36 +4,49 @@ import asyncio
 from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Request, Depends, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Dict, List
+from typing import Annotated, Dict, List, Set
 from read_files import ReadFiles
-from context_manager import ContextManager
+from context_manager import ContextManager, uuid4_batch
 from login import LoginHandler
 from agent import Agent
 import logging
-from fastapi.responses import JSONResponse, RedirectResponse, Response, FileResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from fastapi.responses import ORJSONResponse, RedirectResponse, Response, FileResponse, StreamingResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
 import time
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 import io
-import uuid
 import re
+import string
 import traceback
 import base64
-from pymongo import MongoClient
+import hashlib
+import orjson
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import pathlib
-from datetime import datetime
+from datetime import datetime, timezone
 import googlemaps
 from googlemaps.exceptions import ApiError
 import urllib.parse
 from rapidfuzz import process, fuzz
 import requests
+import httpx
 from pydub import AudioSegment
 from openai import AsyncOpenAI
 from pymongo.errors import CollectionInvalid
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import math
+import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    # libuv-based event loop; uvicorn's default "auto" loop also picks it up once installed
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 
 load_dotenv()
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -47,28 +60,64 @@ ELEVENLABS_MODEL_ID_TTS = os.getenv("ELEVENLABS_MODEL_ID_TTS", "eleven_multiling
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 session_storage = {}
-websocket_connections: Dict[str, List[WebSocket]] = {}
+websocket_connections: Dict[str, Set[WebSocket]] = {}
+ALLOWED_EXTENSIONS = frozenset({"pdf", "doc", "docx"})
 
 gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY) if GOOGLE_MAPS_API_KEY else None
 agent = Agent()
 openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-
-class DebugMiddleware(BaseHTTPMiddleware):
+# Pooled async client for the Google Places/Routes REST calls so they don't block the event loop;
+# both APIs sit behind the googleapis.com edge, so HTTP/2 lets them share one connection
+maps_http_client = httpx.AsyncClient(http2=True, timeout=10, limits=httpx.Limits(max_connections=100, max_keepalive_connections=32))
+# Keep-alive session for the ElevenLabs STT/TTS calls (made from worker threads)
+elevenlabs_session = requests.Session()
+
+# Plain ASGI middleware: BaseHTTPMiddleware would add an extra task and stream wrapper to every request
+class DebugMiddleware:
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-
-    async def dispatch(self, request: Request, call_next):
-        logger.debug(f"Request path: {request.url.path}")
-        logger.debug(f"Request headers: {dict(request.headers)}")
-        if request.headers.get("content-type", "").startswith("multipart/form-data"):
-            logger.debug("Multipart form data request detected")
-        response = await call_next(request)
-        return response
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and logger.isEnabledFor(logging.DEBUG):
+            headers = Headers(scope=scope)
+            logger.debug(f"Request path: {scope['path']}")
+            logger.debug(f"Request headers: {dict(headers)}")
+            if headers.get("content-type", "").startswith("multipart/form-data"):
+                logger.debug("Multipart form data request detected")
+        await self.app(scope, receive, send)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+# Rejects oversize bodies from the declared Content-Length before any of the body is read
+class ContentLengthLimitMiddleware:
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > self.max_bytes:
+                        logger.error(f"Rejected {scope['path']}: Content-Length {int(value)} exceeds {self.max_bytes} bytes")
+                        body = orjson.dumps({"detail": f"Request body too large. Limit is {self.max_bytes} bytes"})
+                        await send({
+                            "type": "http.response.start",
+                            "status": 413,
+                            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+                        })
+                        await send({"type": "http.response.body", "body": body})
+                        return
+                    break
+        await self.app(scope, receive, send)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 router = APIRouter()
 
-app.add_middleware(DebugMiddleware)
+# Opt-in only: read_files.py configures the root logger at DEBUG, so the log level can't gate this
+if os.getenv("QCHAT_DEBUG", "false").lower() == "true":
+    app.add_middleware(DebugMiddleware)
+app.add_middleware(ContentLengthLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8080"],
@@ -78,17 +127,22 @@ app.add_middleware(
 )
 
 file_reader = ReadFiles()
-context_manager = ContextManager()
+context_manager = ContextManager(agent=agent)
 login_handler = LoginHandler()
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("python_multipart").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-mongo_client = MongoClient("mongodb://localhost:27017")
+mongo_client = AsyncIOMotorClient("mongodb://localhost:27017", tz_aware=True)
 db = mongo_client["document_analysis"]
 sessions_collection = db["sessions"]
 
+# session_id -> (user_id, email, expires_at, cached_at); short-lived so revocations propagate quickly
+_session_cache: "OrderedDict[str, tuple]" = OrderedDict()
+SESSION_CACHE_TTL = 30
+SESSION_CACHE_MAX_SIZE = 10000
+
 security = HTTPBearer(auto_error=False)
 
 async def verify_session(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -97,13 +151,22 @@ async def verify_session(credentials: HTTPAuthorizationCredentials = Depends(sec
         raise HTTPException(status_code=401, detail="Invalid or missing Authorization header")
     session_id = credentials.credentials
     try:
-        session = sessions_collection.find_one({"session_id": session_id})
+        now = datetime.now(timezone.utc)
+        cached = _session_cache.get(session_id)
+        if cached and cached[2] > now and time.monotonic() - cached[3] < SESSION_CACHE_TTL:
+            _session_cache.move_to_end(session_id)
+            return {"user_id": cached[0], "email": cached[1]}
+        session = await sessions_collection.find_one({"session_id": session_id})
         if not session:
             logger.error(f"Invalid session ID: {session_id}")
             raise HTTPException(status_code=401, detail="Invalid session ID")
-        if session.get("expires_at") < datetime.utcnow():
+        if session.get("expires_at") < now:
             logger.error(f"Session expired: {session_id}")
             raise HTTPException(status_code=401, detail="Session expired")
+        _session_cache[session_id] = (session["user_id"], session["email"], session["expires_at"], time.monotonic())
+        _session_cache.move_to_end(session_id)
+        if len(_session_cache) > SESSION_CACHE_MAX_SIZE:
+            _session_cache.popitem(last=False)
         logger.info(f"Verified session {session_id} for user {session['email']}")
         return {"user_id": session["user_id"], "email": session["email"]}
     except Exception as e:
@@ -129,7 +192,10 @@ async def verify_websocket_session(session_id: str):
         raise HTTPException(status_code=500, detail=f"Error validating WebSocket session: {str(e)}")
 
 class QueryRequest(BaseModel):
-    query: str
+    # Unknown fields are dropped and bounds are checked in pydantic-core before any handler work
+    model_config = ConfigDict(extra="ignore")
+
+    query: Annotated[str, Field(min_length=1, max_length=8192)]
     role: str
 
 class SessionRequest(BaseModel):
@@ -139,12 +205,92 @@ class SessionRequest(BaseModel):
 class InitialMessageRequest(BaseModel):
     message: str
 
+# A precompiled fullmatch benchmarks faster here than uuid.UUID() + try/except, and unlike uuid.UUID it
+# rejects the braced, URN and hyphenless spellings session ids never use
+_UUID_RE = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}',
+    re.IGNORECASE
+)
+
+_HTML_TAG_RE = re.compile(r'<[^<]+?>')
+# Characters urllib.parse.quote leaves untouched with its default safe="/"
+_NEEDS_QUOTE_RE = re.compile(r'[^A-Za-z0-9_.\-~/]')
+
+_QUOTE_SAFE_CHARS = frozenset(string.ascii_letters + string.digits + "_.-~/")
+# Percent-encoding for every unsafe ASCII character, applied in one C-level str.translate pass
+_QUOTE_TABLE = str.maketrans({chr(b): f"%{b:02X}" for b in range(128) if chr(b) not in _QUOTE_SAFE_CHARS})
+
+def fast_quote(value: str) -> str:
+    """urllib.parse.quote that skips the encoder when nothing in value would change."""
+    if not _NEEDS_QUOTE_RE.search(value):
+        return value
+    if value.isascii():
+        return value.translate(_QUOTE_TABLE)
+    # Non-ASCII needs UTF-8 byte encoding, which only quote() does
+    return urllib.parse.quote(value)
+
 def is_valid_uuid(value: str) -> bool:
-    uuid_pattern = re.compile(
-        r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$',
-        re.IGNORECASE
+    return _UUID_RE.fullmatch(value) is not None
+
+_PONG_FRAME = orjson.dumps({"type": "pong"}).decode()
+
+async def send_ws_json(ws: WebSocket, payload: dict) -> None:
+    await ws.send_text(orjson.dumps(payload).decode())
+
+async def receive_ws_json(ws: WebSocket):
+    return orjson.loads(await ws.receive_text())
+
+async def _send_all(ws: WebSocket, frames: List[str]) -> None:
+    for frame in frames:
+        await ws.send_text(frame)
+
+async def broadcast(session_id: str, *payloads: dict, exclude: WebSocket = None) -> None:
+    """Send payloads to every socket of a session concurrently and prune the ones that fail."""
+    conns = [ws for ws in websocket_connections.get(session_id, ()) if ws is not exclude]
+    if not conns:
+        return
+    # Serialize each payload once instead of once per subscriber in send_json
+    frames = [orjson.dumps(payload).decode() for payload in payloads]
+    results = await asyncio.gather(*(_send_all(ws, frames) for ws in conns), return_exceptions=True)
+    for ws, result in zip(conns, results):
+        if isinstance(result, Exception):
+            logger.error(f"WebSocket broadcast failed for session {session_id}: {str(result)}")
+            live = websocket_connections.get(session_id)
+            if live:
+                live.discard(ws)
+    logger.debug(f"Broadcasted {len(payloads)} message(s) to {len(conns)} WebSocket(s) for session {session_id}")
+
+async def _warm(name: str, coro) -> None:
+    try:
+        await coro
+    except Exception as e:
+        logger.warning(f"{name} warm-up failed, first request will connect lazily: {str(e)}")
+
+async def _ensure_index(name: str, coro) -> None:
+    # An unreachable Mongo or an existing index with different options must not keep the app from booting
+    try:
+        await coro
+    except Exception as e:
+        logger.warning(f"Could not ensure {name} index, continuing with existing indexes: {str(e)}")
+
+@app.on_event("startup")
+async def startup():
+    # Expired login sessions are purged by Mongo itself
+    await _ensure_index("sessions.expires_at", sessions_collection.create_index("expires_at", expireAfterSeconds=0))
+    await _ensure_index("sessions.session_id", sessions_collection.create_index("session_id", unique=True))
+    await _ensure_index("share token", context_manager.ensure_indexes())
+    # Pay TLS handshakes, credential checks and model init here rather than on the first user request
+    await asyncio.gather(
+        context_manager.warmup(),
+        _warm("Storage", context_manager.warmup_connections()),
+        _warm("OpenAI", agent.client.models.list())
     )
-    return bool(uuid_pattern.match(value))
+
+@app.on_event("shutdown")
+async def shutdown():
+    await maps_http_client.aclose()
+    elevenlabs_session.close()
+    await context_manager.drain_background_tasks()
 
 @app.get("/login")
 async def initiate_login():
@@ -170,7 +316,8 @@ async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         if credentials and credentials.scheme == "Bearer" and credentials.credentials:
             session_id = credentials.credentials
-            sessions_collection.delete_one({"session_id": session_id})
+            await sessions_collection.delete_one({"session_id": session_id})
+            _session_cache.pop(session_id, None)
             logger.info(f"Session {session_id} invalidated")
         return RedirectResponse(url="http://localhost:8080/")
     except Exception as e:
@@ -189,7 +336,7 @@ async def favicon():
 async def get_sessions():
     try:
         sessions = await context_manager.list_sessions()
-        return JSONResponse(content={"sessions": sessions})
+        return ORJSONResponse(content={"sessions": sessions})
     except Exception as e:
         logger.error(f"Error fetching sessions: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching sessions: {str(e)}")
@@ -197,82 +344,86 @@ async def get_sessions():
 @app.post("/create-session/", dependencies=[Depends(verify_session)])
 async def create_session(request: SessionRequest):
     try:
-        start_time = time.time()
-        session_id = str(uuid.uuid4())
-        share_token = str(uuid.uuid4())
+        start_time = time.perf_counter_ns()
+        session_id, share_token = uuid4_batch(2)
         await context_manager.create_session(session_id, request.candidate_name, request.candidate_email, share_token)
         logger.info(f"Created new session: {session_id} for {request.candidate_name}")
 
         session = await context_manager.get_session(session_id)
         initial_message = session["chat_history"][0]["query"]
         logger.info(f"Broadcasting and saving initial message: '{initial_message}' for session {session_id}")
-        if session_id in websocket_connections:
-            for ws in websocket_connections[session_id]:
-                try:
-                    await ws.send_json({
-                        "role": "system",
-                        "content": initial_message,
-                        "timestamp": time.time(),
-                        "type": "initial"
-                    })
-                    logger.debug(f"Sent WebSocket message to client for session {session_id}")
-                except Exception as e:
-                    logger.error(f"WebSocket broadcast failed for session {session_id}: {str(e)}")
-                    websocket_connections[session_id].remove(ws)
+        await broadcast(session_id, {
+            "role": "system",
+            "content": initial_message,
+            "timestamp": time.time(),
+            "type": "initial"
+        })
 
-        logger.info(f"Session creation time: {time.time() - start_time:.2f} seconds")
-        return JSONResponse(content={"session_id": session_id, "share_token": share_token})
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Session creation time: %.2f ms", (time.perf_counter_ns() - start_time) / 1e6)
+        return ORJSONResponse(content={"session_id": session_id, "share_token": share_token})
     except Exception as e:
         logger.error(f"Error creating session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error creating session: {str(e)}")
 
+# Above this many characters the response is encoded per file instead of as one buffer
+EXTRACT_STREAM_THRESHOLD = int(os.getenv("EXTRACT_STREAM_THRESHOLD", str(1024 * 1024)))
+
+def _stream_extracted_text(session_id: str, extracted_text: Dict[str, str]):
+    # Same JSON shape as the ORJSONResponse path, one encoded file entry at a time
+    yield b'{"session_id":' + orjson.dumps(session_id) + b',"extracted_text":{'
+    for i, (filename, text) in enumerate(extracted_text.items()):
+        yield (b"," if i else b"") + orjson.dumps(filename) + b":" + orjson.dumps(text)
+    yield b"}}"
+
 @app.post("/extract-text/{session_id}")
 async def extract_text_from_files(session_id: str, files: List[UploadFile] = File(...)):
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
     try:
         if not is_valid_uuid(session_id):
             raise HTTPException(status_code=400, detail="Invalid session_id format. Must be a valid UUID.")
+        if not await context_manager.session_exists(session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
        
-        logger.info(f"Received {len(files)} files for session {session_id}: {[file.filename for file in files]}")
-        allowed_extensions = ["pdf", "doc", "docx"]
-        file_contents = []
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Received %d files for session %s: %s", len(files), session_id, [file.filename for file in files])
         for file in files:
             if not file.filename:
                 raise HTTPException(status_code=400, detail="No filename provided for one or more files")
-            file_ext = file.filename.split(".")[-1].lower()
-            if file_ext not in allowed_extensions:
+            file_ext = file.filename.rpartition(".")[2].lower()
+            if file_ext not in ALLOWED_EXTENSIONS:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Unsupported file format: {file_ext}. Supported formats: {allowed_extensions}"
+                    detail=f"Unsupported file format: {file_ext}. Supported formats: {sorted(ALLOWED_EXTENSIONS)}"
                 )
-            content = await file.read()
-            if not content:
+        # Hand the spooled upload files to the reader instead of copying each body into memory
+        file_contents = []
+        for file in files:
+            if not file.size:
                 raise HTTPException(status_code=400, detail=f"Empty file: {file.filename}")
-            file_contents.append((file.filename, io.BytesIO(content)))
-            logger.debug(f"Read {file.filename} into memory")
+            await file.seek(0)
+            file_contents.append((file.filename, file.file))
+            logger.debug(f"Queued {file.filename} ({file.size} bytes) for extraction")
        
-        results = await file_reader.file_reader(file_contents)
-        extracted_text = {filename: text for filename, text in results.items()}
-        for filename, text in extracted_text.items():
-            logger.info(f"Processed {filename}: {len(text)} characters")
+        # Stream files into storage as they finish so embedding overlaps the remaining extraction
+        extracted_text = await context_manager.store_session_data(session_id, file_reader.iter_files(file_contents))
+        if logger.isEnabledFor(logging.INFO):
+            for filename, text in extracted_text.items():
+                logger.info("Processed %s: %d characters", filename, len(text))
        
-        await context_manager.store_session_data(session_id, extracted_text)
-       
-        if session_id in websocket_connections:
-            for ws in websocket_connections[session_id]:
-                try:
-                    for filename in extracted_text.keys():
-                        await ws.send_json({
-                            "type": "file_uploaded",
-                            "filename": filename,
-                            "path": f"uploads/{session_id}/{filename}",
-                            "timestamp": time.time()
-                        })
-                except:
-                    websocket_connections[session_id].remove(ws)
+        ts = time.time()
+        await broadcast(session_id, *({
+            "type": "file_uploaded",
+            "filename": filename,
+            "path": f"uploads/{session_id}/{filename}",
+            "timestamp": ts
+        } for filename in extracted_text.keys()))
        
-        logger.info(f"Total processing time: {time.time() - start_time:.2f} seconds")
-        return JSONResponse(content={"session_id": session_id, "extracted_text": extracted_text})
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Total processing time: %.2f ms", (time.perf_counter_ns() - start_time) / 1e6)
+        if sum(len(text) for text in extracted_text.values()) > EXTRACT_STREAM_THRESHOLD:
+            return StreamingResponse(_stream_extracted_text(session_id, extracted_text), media_type="application/json")
+        return ORJSONResponse(content={"session_id": session_id, "extracted_text": extracted_text})
    
     except HTTPException as e:
         logger.error(f"HTTP error: {e.detail}")
@@ -303,7 +454,7 @@ async def get_files(session_id: str):
         extracted_text = session.get("extracted_text", {})
         files = [{"filename": filename, "path": f"uploads/{session_id}/{filename}"} for filename in extracted_text.keys()]
         logger.info(f"Retrieved {len(files)} files for session {session_id}")
-        return JSONResponse(content={"files": files})
+        return ORJSONResponse(content={"files": files})
     except HTTPException as e:
         logger.error(f"HTTP error: {e.detail}")
         raise
@@ -338,19 +489,20 @@ async def get_messages(session_id: str):
             raise HTTPException(status_code=404, detail="Session not found")
        
         chat_history = session.get("chat_history", [])
+        ts = time.time()
         messages = [
             {
                 "role": msg["role"],
                 "query": msg.get("query", ""),
                 "response": msg.get("response", ""),
-                "timestamp": msg.get("timestamp", time.time()),
+                "timestamp": msg.get("timestamp", ts),
                 "audio_base64": msg.get("audio_base64"),
                 "map_data": msg.get("map_data")
             }
             for msg in chat_history
         ]
         logger.info(f"Retrieved {len(messages)} messages for session {session_id}")
-        return JSONResponse(content={"messages": messages})
+        return ORJSONResponse(content={"messages": messages})
     except HTTPException as e:
         logger.error(f"HTTP error: {e.detail}")
         raise
@@ -365,19 +517,14 @@ async def send_initial_message(session_id: str, req: InitialMessageRequest):
             raise HTTPException(status_code=400, detail="Invalid session_id format. Must be a valid UUID.")
        
         await context_manager.add_initial_message(session_id, req.message)
-        if session_id in websocket_connections:
-            for ws in websocket_connections[session_id]:
-                try:
-                    await ws.send_json({
-                        "role": "hr",
-                        "content": req.message,
-                        "timestamp": time.time(),
-                        "type": "initial"
-                    })
-                except:
-                    websocket_connections[session_id].remove(ws)
+        await broadcast(session_id, {
+            "role": "hr",
+            "content": req.message,
+            "timestamp": time.time(),
+            "type": "initial"
+        })
        
-        return JSONResponse(content={"status": "Initial message sent and flag set"})
+        return ORJSONResponse(content={"status": "Initial message sent and flag set"})
     except Exception as e:
         logger.error(f"Error sending initial message for session {session_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error sending initial message: {str(e)}")
@@ -394,7 +541,7 @@ async def generate_share_link(session_id: str):
             raise HTTPException(status_code=403, detail="Initial message must be sent before generating share link")
         share_token = session.get("share_token")
         link = f"http://localhost:8080/candidate-chat?token={share_token}"
-        return JSONResponse(content={"share_link": link})
+        return ORJSONResponse(content={"share_link": link})
     except HTTPException as e:
         logger.error(f"HTTP error: {e.detail}")
         raise
@@ -410,7 +557,7 @@ async def get_session(session_id: str):
         session = await context_manager.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "initial_message_sent": session.get("initial_message_sent", False)
         })
     except Exception as e:
@@ -425,7 +572,7 @@ async def validate_token(token: str):
             logger.warning(f"Invalid or expired token: {token}")
             raise HTTPException(status_code=401, detail="Invalid or expired token")
         logger.info(f"Validated token {token} for session {session_id}")
-        return JSONResponse(content={"session_id": session_id})
+        return ORJSONResponse(content={"session_id": session_id})
     except HTTPException as e:
         raise
     except Exception as e:
@@ -434,18 +581,19 @@ async def validate_token(token: str):
 
 async def process_chat_query(session_id: str, query_req: QueryRequest):
     try:
+        ts = time.time()
         session = await context_manager.get_session(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
         history = session.get("chat_history", [])
-        query_corrected = await agent.correct_query(query_req.query, history, query_req.role)
-
-        agent_instance = Agent()
-        intent_data = await agent_instance.classify_intent_and_extract(query_corrected, history, query_req.role)
+        # Correction runs inside classify_intent_and_extract, concurrently with classifying the raw query
+        query_corrected, intent_data = await agent.classify_intent_and_extract(query_req.query, history, query_req.role)
 
         is_map_query = intent_data.get("is_map", False)
         map_data = None
         media_data = None
         if is_map_query:
-            logger.info(f"Routing query '{query_corrected}' as map-related (is_map: {is_map_query}) with intent_data: {intent_data}")
+            logger.info("Routing query '%s' as map-related (is_map: %s) with intent_data: %s", query_corrected, is_map_query, intent_data)
             try:
                 map_data = await handle_map_query(session_id, QueryRequest(
                     query=query_corrected,
@@ -457,71 +605,62 @@ async def process_chat_query(session_id: str, query_req: QueryRequest):
                 logger.error(f"Full traceback: {traceback.format_exc()}")
                 logger.error(f"Intent data: {intent_data}, Query: {query_corrected}")
                 response = f"Sorry, I couldn't process the location request for '{query_corrected}'. Please rephrase."
-                history.append({
+                entry = {
                     "role": query_req.role,
                     "query": query_corrected,
                     "response": response,
-                    "timestamp": time.time(),
+                    "timestamp": ts,
                     "intent_data": intent_data,
                     "map_data": None
-                })
-                collection_name = f"sessions_{session_id}"
-                await context_manager.db[collection_name].update_one(
-                    {"session_id": session_id},
-                    {"$set": {"chat_history": history[-10:], "updated_at": time.time()}}
-                )
+                }
+                history = await context_manager.append_history(session_id, [entry], session)
                 logger.warning(f"Fallback response stored for map query failure in session {session_id}")
         else:
-            logger.info(f"Routing query '{query_corrected}' as non-map (is_map: {is_map_query}) with intent_data: {intent_data}")
-            session_data = await context_manager.get_session(session_id)
+            logger.info("Routing query '%s' as non-map (is_map: %s) with intent_data: %s", query_corrected, is_map_query, intent_data)
+            # Nothing writes to the session between the lookup above and here
+            session_data = session
             if not session_data.get("extracted_text") and intent_data.get("intent") == "document":
                 response = "No documents available to answer your query. Please upload relevant documents or ask a location-based question."
                 history.append({
                     "role": query_req.role,
                     "query": query_corrected,
                     "response": response,
-                    "timestamp": time.time(),
+                    "timestamp": ts,
                     "intent_data": intent_data
                 })
                 await context_manager.store_session_data(session_id, {"extracted_text": {}})
             else:
                 response, media_data, history = await context_manager.process_query(session_id, query_corrected, query_req.role, intent_data=intent_data)
-                logger.debug(f"Non-map query processed, media_data: {media_data}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Non-map query processed, media_data: {media_data}")
 
         # Broadcast to all WebSocket connections
         if session_id in websocket_connections:
-            for ws in websocket_connections[session_id]:
-                try:
-                    ws_response = {
-                        "role": query_req.role,
-                        "content": query_corrected,
-                        "timestamp": time.time(),
-                        "type": "query"
-                    }
-                    await ws.send_json(ws_response)
-                    ws_response = {
-                        "role": "assistant",
-                        "content": response,
-                        "timestamp": time.time(),
-                    }
-                    if is_map_query:
-                        # Include all map_data fields, including coordinates and encoded_polyline
-                        ws_response["map_data"] = {
-                            "type": map_data.get("type"),
-                            "data": map_data.get("data"),
-                            "map_url": map_data.get("map_url"),
-                            "static_map_url": map_data.get("static_map_url"),
-                            "coordinates": map_data.get("coordinates"),
-                            "llm_response": map_data.get("llm_response"),
-                            "encoded_polyline": map_data.get("encoded_polyline")
-                        }
-                    else:
-                        ws_response["media_data"] = media_data
-                    await ws.send_json(ws_response)
-                    logger.debug(f"Broadcasted query and response to WebSocket for session {session_id}")
-                except Exception as e:
-                    logger.error(f"WebSocket broadcast failed for session {session_id}: {str(e)}")
-                    websocket_connections[session_id].remove(ws)
+            query_message = {
+                "role": query_req.role,
+                "content": query_corrected,
+                "timestamp": ts,
+                "type": "query"
+            }
+            ws_response = {
+                "role": "assistant",
+                "content": response,
+                "timestamp": ts,
+            }
+            if is_map_query:
+                # Include all map_data fields, including coordinates and encoded_polyline
+                ws_response["map_data"] = {
+                    "type": map_data.get("type"),
+                    "data": map_data.get("data"),
+                    "map_url": map_data.get("map_url"),
+                    "static_map_url": map_data.get("static_map_url"),
+                    "coordinates": map_data.get("coordinates"),
+                    "llm_response": map_data.get("llm_response"),
+                    "encoded_polyline": map_data.get("encoded_polyline")
+                }
+            else:
+                ws_response["media_data"] = media_data
+            await broadcast(session_id, query_message, ws_response)
 
         return response, map_data, media_data, history, is_map_query
     except Exception as e:
@@ -534,8 +673,8 @@ async def chat_with_documents(session_id: str, query_req: QueryRequest):
         if not is_valid_uuid(session_id):
             raise HTTPException(status_code=400, detail="Invalid session_id format. Must be a valid UUID.")
        
-        start_time = time.time()
-        logger.info(f"Received chat query for session {session_id}: {query_req.query} by {query_req.role}")
+        start_time = time.perf_counter_ns()
+        logger.info("Received chat query for session %s: %s by %s", session_id, query_req.query, query_req.role)
 
         response, map_data, media_data, history, is_map_query = await process_chat_query(session_id, query_req)
 
@@ -545,10 +684,12 @@ async def chat_with_documents(session_id: str, query_req: QueryRequest):
         }
         if not is_map_query and media_data:
             response_data["media_data"] = media_data
-            logger.debug(f"Including media_data in HTTP response: {media_data}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Including media_data in HTTP response: {media_data}")
        
-        logger.info(f"Chat processing time: {time.time() - start_time:.2f} seconds")
-        return JSONResponse(content=response_data)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Chat processing time: %.2f ms", (time.perf_counter_ns() - start_time) / 1e6)
+        return ORJSONResponse(content=response_data)
     except HTTPException as e:
         logger.error(f"HTTP error: {e.detail}")
         raise
@@ -580,9 +721,170 @@ quadrant_locations = [
     {"city": "Singapore", "address": "#02-01, 68 Circular Road, Singapore, 049422", "lat": 1.2864, "lng": 103.8491},
     {"city": "Chiswick, UK", "address": "Gold Building 3 Chiswick Business Park, Chiswick, London, W4 5YA", "lat": 51.4937, "lng": -0.2786}
 ]
+# Office addresses and coordinates are fixed, so build their map links once
+for loc in quadrant_locations:
+    loc["map_url"] = f"https://www.google.com/maps/search/?api=1&query={fast_quote(loc['address'])}"
+    loc["static_map_base"] = f"https://maps.googleapis.com/maps/api/staticmap?center={loc['lat']},{loc['lng']}&zoom=15&size=600x300&markers=color:purple|label:Q|{loc['lat']},{loc['lng']}"
+
+# multi_location answers are identical for every request, so build the payload once
+QUADRANT_LOCATIONS_CACHED = [
+    {
+        "city": loc["city"],
+        "address": loc["address"],
+        "map_url": loc["map_url"],
+        "static_map_url": loc["static_map_base"] + f"&key={GOOGLE_MAPS_API_KEY}"
+    }
+    for loc in quadrant_locations
+]
+_MULTI_SEARCH_URL = "https://www.google.com/maps/search/?api=1&query=Quadrant%20Technologies"
+# Static map templates for nearby results with the constant API key already inlined
+_PLACE_STATIC_MAP_TEMPLATE = (
+    "https://maps.googleapis.com/maps/api/staticmap?center={0},{1}&zoom=15&size=150x112&markers=color:red|{0},{1}"
+    f"&key={GOOGLE_MAPS_API_KEY}"
+)
+_NEARBY_STATIC_MAP_TEMPLATE = (
+    "https://maps.googleapis.com/maps/api/staticmap?center={0},{1}&zoom=13&size=600x300&markers={2}"
+    f"&key={GOOGLE_MAPS_API_KEY}"
+)
+
+# Lowercase city -> location, built once so lookups don't rescan the list per query
+_CITY_INDEX = {loc["city"].lower(): loc for loc in quadrant_locations}
+_CITY_NAMES = list(_CITY_INDEX.keys())
+
+# Places price_level is 0-4; index it instead of joining a list of "$" per place
+_PRICE_LEVEL_DISPLAY = ("", "$", "$$", "$$$", "$$$$")
+
+def _price_display(price_level) -> str:
+    if price_level is None:
+        return 'N/A'
+    if 0 <= price_level < len(_PRICE_LEVEL_DISPLAY):
+        return _PRICE_LEVEL_DISPLAY[price_level]
+    return '$' * price_level
+
+@lru_cache(maxsize=512)
+def _pretty_place_type(place_type: str) -> str:
+    # Place types are a closed vocabulary, so each one is formatted once per process
+    return place_type.replace('_', ' ').title()
+
+def _process_place(place, seen_place_ids, data_list, coordinates, markers, centroid, include_preview=True,
+                   quote=fast_quote, static_map_template=_PLACE_STATIC_MAP_TEMPLATE):
+    """Append one Places result to the nearby payload lists (and the [sum_lat, sum_lng, count] centroid) unless it was already shown.
+
+    Without include_preview the item carries no static_map_url; clients can build one from the matching coordinates entry.
+    """
+    place_id = place['place_id']
+    if place_id in seen_place_ids:
+        return
+    place_lat, place_lng = place['geometry']['location']['lat'], place['geometry']['location']['lng']
+    name = place['name']
+    vicinity = place.get('vicinity')
+    label = vicinity if vicinity is not None else name
+    types = place.get('types')
+    place_type = _pretty_place_type(types[0]) if types else 'N/A'
+    item = {
+        "name": name,
+        "address": vicinity if vicinity is not None else 'N/A',
+        "map_url": f"https://www.google.com/maps/search/?api=1&query={quote(label)}",
+        "rating": place.get('rating', 'N/A'),
+        "total_reviews": place.get('user_ratings_total', 0),
+        "type": place_type,
+        "price_level": _price_display(place.get('price_level'))
+    }
+    if include_preview:
+        item["static_map_url"] = static_map_template.format(place_lat, place_lng)
+    data_list.append(item)
+    coordinates.append({
+        "lat": place_lat,
+        "lng": place_lng,
+        "label": label
+    })
+    markers.append(f"color:red|{place_lat},{place_lng}")
+    centroid[0] += place_lat
+    centroid[1] += place_lng
+    centroid[2] += 1
+    seen_place_ids.add(place_id)
+
+def _haversine_np(lat1: float, lon1: float, lats2, lons2) -> np.ndarray:
+    """Great-circle distance in km from one point to arrays of points."""
+    lat1, lon1 = np.radians(lat1), np.radians(lon1)
+    lats2, lons2 = np.radians(np.asarray(lats2, dtype=float)), np.radians(np.asarray(lons2, dtype=float))
+    a = np.sin((lats2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lats2) * np.sin((lons2 - lon1) / 2) ** 2
+    return 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+PAGE_TOKEN_MAX_WAIT = 2.0
+
+async def fetch_next_places_page(location: dict, keyword: str, page_token: str) -> dict:
+    """Poll for a next_page_token to become valid with 200ms/400ms/800ms backoff instead of a fixed 2s sleep."""
+    delay, waited = 0.2, 0.0
+    while True:
+        await asyncio.sleep(delay)
+        waited += delay
+        try:
+            return await asyncio.to_thread(
+                gmaps.places_nearby,
+                location={"lat": location["lat"], "lng": location["lng"]},
+                radius=2000,
+                keyword=keyword,
+                page_token=page_token
+            )
+        except ApiError as e:
+            # Google answers INVALID_REQUEST until a freshly issued token activates
+            if e.status != "INVALID_REQUEST" or waited >= PAGE_TOKEN_MAX_WAIT:
+                raise
+            delay = min(delay * 2, PAGE_TOKEN_MAX_WAIT - waited)
+            logger.debug(f"next_page_token not ready after {waited:.1f}s, retrying in {delay:.1f}s")
+
+# Destinations further than 100 km are rejected; anything past 150 km on the cheap estimate is
+# rejected without the full haversine (the margin covers the equirectangular approximation error)
+_FAR_REJECT_SQ_KM = 150.0 * 150.0
+
+def _equirect_sq_km(lat1: float, lon1: float, lats2: np.ndarray, lons2: np.ndarray) -> np.ndarray:
+    """Squared equirectangular distance estimate in km^2; only one cosine per point, no sqrt/atan2."""
+    dlat_km = (lats2 - lat1) * 111.0
+    dlng_km = (lons2 - lon1) * 111.0 * np.cos(np.radians((lats2 + lat1) / 2))
+    return dlat_km * dlat_km + dlng_km * dlng_km
+
+# (destination, source city) -> Places searchText candidates; office cities are fixed, so lookups repeat a lot
+_places_cache: "OrderedDict[tuple, list]" = OrderedDict()
+PLACES_CACHE_MAX_SIZE = 1024
+
+async def search_destination(destination: str, source: dict) -> list:
+    key = (destination.lower(), source["city"])
+    places = _places_cache.get(key)
+    if places is not None:
+        _places_cache.move_to_end(key)
+        logger.debug(f"Places cache hit for '{destination}' near {source['city']}")
+        return places
+
+    places_url = "https://places.googleapis.com/v1/places:searchText"
+    headers = {
+        "X-Goog-Api-Key": GOOGLE_MAPS_API_KEY,
+        "X-Goog-FieldMask": "places.id,places.displayName,places.formattedAddress,places.location",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "textQuery": f"{destination} near {source['city']}",
+        "locationBias": {
+            "circle": {
+                "center": {"latitude": source["lat"], "longitude": source["lng"]},
+                "radius": 50000
+            }
+        }
+    }
+    places_response = await maps_http_client.post(places_url, content=orjson.dumps(payload), headers=headers)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Places API request payload: {payload}")
+        logger.debug(f"Places API response: {places_response.text}")
+    places_response.raise_for_status()
+    places = orjson.loads(places_response.content).get("places") or []
+    if places:
+        _places_cache[key] = places
+        if len(_places_cache) > PLACES_CACHE_MAX_SIZE:
+            _places_cache.popitem(last=False)
+    return places
 
 @app.post("/map-query/{session_id}")
-async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data: dict = None):
+async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data: dict = None, include_previews: bool = True):
     try:
         if not gmaps:
             raise HTTPException(status_code=500, detail="Google Maps API key not configured")
@@ -607,13 +909,10 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
 
         location = None
         if city_query:
-            location = next((loc for loc in quadrant_locations if loc["city"].lower() == city_query), None)
+            location = _CITY_INDEX.get(city_query)
             if not location:
-                for loc in quadrant_locations:
-                    score = fuzz.partial_ratio(city_query, loc["city"].lower())
-                    if score >= 80:
-                        location = loc
-                        break
+                match = process.extractOne(city_query, _CITY_NAMES, scorer=fuzz.partial_ratio, score_cutoff=80)
+                location = _CITY_INDEX[match[0]] if match else None
                 if not location:
                     raise HTTPException(status_code=404, detail=f"Quadrant Technologies location not found for {city_query}")
 
@@ -621,33 +920,19 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
             if not location:
                 raise HTTPException(status_code=400, detail="Please specify a valid city for location query")
             
-            map_url = f"https://www.google.com/maps/search/?api=1&query={urllib.parse.quote(location['address'])}"
-            static_map_url = f"https://maps.googleapis.com/maps/api/staticmap?center={location['lat']},{location['lng']}&zoom=15&size=600x300&markers=color:purple|label:Q|{location['lat']},{location['lng']}&key={GOOGLE_MAPS_API_KEY}"
-            
             map_data = {
                 "type": "address",
                 "data": location["address"],
                 "city": location["city"],
-                "map_url": map_url,
-                "static_map_url": static_map_url
+                "map_url": location["map_url"],
+                "static_map_url": location["static_map_base"] + f"&key={GOOGLE_MAPS_API_KEY}"
             }
 
         elif intent == "multi_location":
-            locations_data = []
-            for loc in quadrant_locations:
-                map_url = f"https://www.google.com/maps/search/?api=1&query={urllib.parse.quote(loc['address'])}"
-                static_map_url = f"https://maps.googleapis.com/maps/api/staticmap?center={loc['lat']},{loc['lng']}&zoom=15&size=600x300&markers=color:purple|label:Q|{loc['lat']},{loc['lng']}&key={GOOGLE_MAPS_API_KEY}"
-                locations_data.append({
-                    "city": loc["city"],
-                    "address": loc["address"],
-                    "map_url": map_url,
-                    "static_map_url": static_map_url
-                })
-            
             map_data = {
                 "type": "multi_location",
-                "data": locations_data,
-                "map_url": "https://www.google.com/maps/search/?api=1&query=Quadrant%20Technologies",
+                "data": QUADRANT_LOCATIONS_CACHED,
+                "map_url": _MULTI_SEARCH_URL,
                 "static_map_url": None
             }
 
@@ -658,11 +943,10 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
             keyword = nearby_type or "nearby amenities"
             logger.info(f"Using keyword for Places API: '{keyword}'")
 
-            if session_id not in session_storage:
-                session_storage[session_id] = {"previous_places": [], "next_page_token": None}
+            nearby_state = session_storage.setdefault(session_id, {"previous_places": set(), "next_page_token": None})
 
             if "more" in query_req.query.lower() if query_req and query_req.query else False:
-                session_storage[session_id]["previous_places"] = []
+                nearby_state["previous_places"].clear()
 
             coordinates = [{
                 "lat": location["lat"],
@@ -670,135 +954,55 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
                 "label": location["address"],
                 "color": "purple"
             }]
+            # Running [sum_lat, sum_lng, count] seeded with the office, updated as places are added
+            centroid = [location["lat"], location["lng"], 1]
 
-            places = gmaps.places_nearby(
+            places = await asyncio.to_thread(
+                gmaps.places_nearby,
                 location={"lat": location["lat"], "lng": location["lng"]},
                 radius=2000,
                 keyword=keyword
             )
             logger.info(f"Places API returned {len(places['results'])} results for keyword '{keyword}' near {location['city']}")
             data_list = []
-            seen_place_ids = set(session_storage[session_id]["previous_places"])
+            # Mutated in place, so the session's set stays current without list<->set round-trips
+            seen_place_ids = nearby_state["previous_places"]
 
             markers = [f"color:purple|label:Q|{location['lat']},{location['lng']}"]
             for place in places['results'][:10]:
-                place_id = place['place_id']
-                place_name = place['name'].lower()
-                if place_id not in seen_place_ids:
-                    place_lat, place_lng = place['geometry']['location']['lat'], place['geometry']['location']['lng']
-                    price_level = place.get('price_level')
-                    price_level_display = ''.join(['$'] * price_level) if price_level is not None else 'N/A'
-                    place_type = place.get('types', [])[0].replace('_', ' ').title() if place.get('types') else 'N/A'
-                    item = {
-                        "name": place['name'],
-                        "address": place.get('vicinity', 'N/A'),
-                        "map_url": f"https://www.google.com/maps/search/?api=1&query={urllib.parse.quote(place.get('vicinity', place['name']))}",
-                        "static_map_url": f"https://maps.googleapis.com/maps/api/staticmap?center={place_lat},{place_lng}&zoom=15&size=150x112&markers=color:red|{place_lat},{place_lng}&key={GOOGLE_MAPS_API_KEY}",
-                        "rating": place.get('rating', 'N/A'),
-                        "total_reviews": place.get('user_ratings_total', 0),
-                        "type": place_type,
-                        "price_level": price_level_display
-                    }
-                    data_list.append(item)
-                    coordinates.append({
-                        "lat": place_lat,
-                        "lng": place_lng,
-                        "label": place.get('vicinity', place['name'])
-                    })
-                    markers.append(f"color:red|{place_lat},{place_lng}")
-                    seen_place_ids.add(place_id)
+                _process_place(place, seen_place_ids, data_list, coordinates, markers, centroid, include_previews)
 
             next_page_token = places.get('next_page_token')
             if next_page_token and len(data_list) < 10 and "more" in query_req.query.lower() if query_req and query_req.query else False:
                 logger.info(f"Fetching more results with next_page_token: {next_page_token}")
-                time.sleep(2)
-                more_places = gmaps.places_nearby(
-                    location={"lat": location["lat"], "lng": location["lng"]},
-                    radius=2000,
-                    keyword=keyword,
-                    page_token=next_page_token
-                )
+                more_places = await fetch_next_places_page(location, keyword, next_page_token)
                 logger.info(f"Places API returned {len(more_places['results'])} additional results")
                 for place in more_places['results'][:10 - len(data_list)]:
-                    place_id = place['place_id']
-                    place_name = place['name'].lower()
-                    if place_id not in seen_place_ids:
-                        place_lat, place_lng = place['geometry']['location']['lat'], place['geometry']['location']['lng']
-                        price_level = place.get('price_level')
-                        price_level_display = ''.join(['$'] * price_level) if price_level is not None else 'N/A'
-                        place_type = place.get('types', [])[0].replace('_', ' ').title() if place.get('types') else 'N/A'
-                        item = {
-                            "name": place['name'],
-                            "address": place.get('vicinity', 'N/A'),
-                            "map_url": f"https://www.google.com/maps/search/?api=1&query={urllib.parse.quote(place.get('vicinity', place['name']))}",
-                            "static_map_url": f"https://maps.googleapis.com/maps/api/staticmap?center={place_lat},{place_lng}&zoom=15&size=150x112&markers=color:red|{place_lat},{place_lng}&key={GOOGLE_MAPS_API_KEY}",
-                            "rating": place.get('rating', 'N/A'),
-                            "total_reviews": place.get('user_ratings_total', 0),
-                            "type": place_type,
-                            "price_level": price_level_display
-                        }
-                        data_list.append(item)
-                        coordinates.append({
-                            "lat": place_lat,
-                            "lng": place_lng,
-                            "label": place.get('vicinity', place['name'])
-                        })
-                        markers.append(f"color:red|{place_lat},{place_lng}")
-                        seen_place_ids.add(place_id)
+                    _process_place(place, seen_place_ids, data_list, coordinates, markers, centroid, include_previews)
 
-            session_storage[session_id]["previous_places"] = list(seen_place_ids)
-            session_storage[session_id]["next_page_token"] = next_page_token if next_page_token else None
-            logger.info(f"Session {session_id} updated: {session_storage[session_id]}")
+            nearby_state["next_page_token"] = next_page_token if next_page_token else None
+            logger.info(f"Session {session_id} updated: {nearby_state}")
 
             if not data_list:
                 logger.warning(f"No {keyword} found within 2000m. Trying broader radius (3000m).")
-                places = gmaps.places_nearby(
+                places = await asyncio.to_thread(
+                    gmaps.places_nearby,
                     location={"lat": location["lat"], "lng": location["lng"]},
                     radius=3000,
                     keyword=keyword
                 )
                 for place in places['results'][:10]:
-                    place_id = place['place_id']
-                    place_name = place['name'].lower()
-                    if place_id not in seen_place_ids:
-                        place_lat, place_lng = place['geometry']['location']['lat'], place['geometry']['location']['lng']
-                        price_level = place.get('price_level')
-                        price_level_display = ''.join(['$'] * price_level) if price_level is not None else 'N/A'
-                        place_type = place.get('types', [])[0].replace('_', ' ').title() if place.get('types') else 'N/A'
-                        item = {
-                            "name": place['name'],
-                            "address": place.get('vicinity', 'N/A'),
-                            "map_url": f"https://www.google.com/maps/search/?api=1&query={urllib.parse.quote(place.get('vicinity', place['name']))}",
-                            "static_map_url": f"https://maps.googleapis.com/maps/api/staticmap?center={place_lat},{place_lng}&zoom=15&size=150x112&markers=color:red|{place_lat},{place_lng}&key={GOOGLE_MAPS_API_KEY}",
-                            "rating": place.get('rating', 'N/A'),
-                            "total_reviews": place.get('user_ratings_total', 0),
-                            "type": place_type,
-                            "price_level": price_level_display
-                        }
-                        data_list.append(item)
-                        coordinates.append({
-                            "lat": place_lat,
-                            "lng": place_lng,
-                            "label": place.get('vicinity', place['name'])
-                        })
-                        markers.append(f"color:red|{place_lat},{place_lng}")
-                        seen_place_ids.add(place_id)
-                session_storage[session_id]["previous_places"] = list(seen_place_ids)
+                    _process_place(place, seen_place_ids, data_list, coordinates, markers, centroid, include_previews)
 
             if not data_list:
                 raise HTTPException(status_code=404, detail=f"No {keyword} found near {location['city']}")
 
-            all_lats = [location["lat"]] + [place["lat"] for place in coordinates[1:]]
-            all_lngs = [location["lng"]] + [place["lng"] for place in coordinates[1:]]
-            center_lat = sum(all_lats) / len(all_lats)
-            center_lng = sum(all_lngs) / len(all_lngs)
+            center_lat = centroid[0] / centroid[2]
+            center_lng = centroid[1] / centroid[2]
             
             unified_map_url = f"https://www.google.com/maps/search/?api=1&query={center_lat},{center_lng}&zoom=13"
             
-            unified_static_map_url = (
-                f"https://maps.googleapis.com/maps/api/staticmap?center={center_lat},{center_lng}"
-                f"&zoom=13&size=600x300&markers={'|'.join(markers)}&key={GOOGLE_MAPS_API_KEY}"
-            )
+            unified_static_map_url = _NEARBY_STATIC_MAP_TEMPLATE.format(center_lat, center_lng, "|".join(markers))
 
             map_data = {
                 "type": "nearby",
@@ -811,21 +1015,21 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
         elif intent == "directions":
             if not location and not city_query:
                 raise HTTPException(status_code=400, detail="Please specify a destination city for directions")
-            source = location or next((loc for loc in quadrant_locations if loc["city"].lower() == city_query), None)
+            source = location or _CITY_INDEX.get(city_query)
             if not source:
                 raise HTTPException(status_code=404, detail="Source Quadrant location not found")
             source_addr = source["address"]
 
             if origin:
-                directions = gmaps.directions(origin, source_addr, mode="driving")
+                directions = await asyncio.to_thread(gmaps.directions, origin, source_addr, mode="driving")
                 if directions:
                     legs = directions[0]['legs'][0]
-                    steps = [re.sub('<[^<]+?>', '', step['html_instructions']) for step in legs['steps']]
+                    steps = [_HTML_TAG_RE.sub('', step['html_instructions']) for step in legs['steps']]
                     origin_addr = legs['start_address']
                     dest_addr = legs['end_address']
                     encoded_polyline = directions[0]['overview_polyline']['points']
-                    map_url = f"https://www.google.com/maps/dir/?api=1&origin={urllib.parse.quote(origin_addr)}&destination={urllib.parse.quote(dest_addr)}&travelmode=driving"
-                    static_map_url = f"https://maps.googleapis.com/maps/api/staticmap?size=600x300&path=enc:{urllib.parse.quote(encoded_polyline)}&markers=label:S|color:green|{legs['start_location']['lat']},{legs['start_location']['lng']}|label:D|color:red|{legs['end_location']['lat']},{legs['end_location']['lng']}&key={GOOGLE_MAPS_API_KEY}"
+                    map_url = f"https://www.google.com/maps/dir/?api=1&origin={fast_quote(origin_addr)}&destination={fast_quote(dest_addr)}&travelmode=driving"
+                    static_map_url = f"https://maps.googleapis.com/maps/api/staticmap?size=600x300&path=enc:{fast_quote(encoded_polyline)}&markers=label:S|color:green|{legs['start_location']['lat']},{legs['start_location']['lng']}|label:D|color:red|{legs['end_location']['lat']},{legs['end_location']['lng']}&key={GOOGLE_MAPS_API_KEY}"
                     map_data = {
                         "type": "directions",
                         "data": steps,
@@ -845,7 +1049,7 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
         elif intent == "distance":
             if not location and not city_query:
                 raise HTTPException(status_code=400, detail="Please specify a city for distance query")
-            source = location or next((loc for loc in quadrant_locations if loc["city"].lower() == city_query), None)
+            source = location or _CITY_INDEX.get(city_query)
             if not source:
                 raise HTTPException(status_code=404, detail="Source Quadrant location not found")
             source_addr = source["address"]
@@ -853,60 +1057,49 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
             if not destination:
                 raise HTTPException(status_code=400, detail="Please specify a destination for distance query")
 
-            places_url = "https://places.googleapis.com/v1/places:searchText"
-            headers = {
-                "X-Goog-Api-Key": GOOGLE_MAPS_API_KEY,
-                "X-Goog-FieldMask": "places.id,places.displayName,places.formattedAddress,places.location"
-            }
-            payload = {
-                "textQuery": f"{destination} near {source['city']}",
-                "locationBias": {
-                    "circle": {
-                        "center": {"latitude": source["lat"], "longitude": source["lng"]},
-                        "radius": 50000
-                    }
-                }
-            }
             try:
-                places_response = requests.post(places_url, json=payload, headers=headers, timeout=10)
-                logger.debug(f"Places API request payload: {payload}")
-                logger.debug(f"Places API response: {places_response.text}")
-                places_response.raise_for_status()
-                places_data = places_response.json()
+                places = await search_destination(destination, source)
                 
-                if not places_data.get("places"):
+                if not places:
                     raise HTTPException(status_code=404, detail=f"Could not find a precise location for {destination} near {source['city']}")
                 
-                place = places_data["places"][0]
+                # Score every candidate at once and take the closest one to the office
+                located = [p for p in places if p.get("location", {}).get("latitude") and p.get("location", {}).get("longitude")]
+                approx_distance = None
+                if located:
+                    lats = np.array([p["location"]["latitude"] for p in located], dtype=float)
+                    lngs = np.array([p["location"]["longitude"] for p in located], dtype=float)
+                    approx_sq = _equirect_sq_km(source["lat"], source["lng"], lats, lngs)
+                    nearest = int(np.argmin(approx_sq))
+                    if approx_sq[nearest] > _FAR_REJECT_SQ_KM:
+                        # Every candidate is clearly past the cut-off, so skip the precise haversine
+                        approx_distance = float(np.sqrt(approx_sq[nearest]))
+                    else:
+                        distances = _haversine_np(source["lat"], source["lng"], lats, lngs)
+                        nearest = int(np.argmin(distances))
+                        approx_distance = float(distances[nearest])
+                    place = located[nearest]
+                else:
+                    place = places[0]
                 place_id = place.get("id")
                 dest_name = place.get("displayName", {}).get("text", destination)
                 dest_addr = place.get("formattedAddress", dest_name)
                 dest_lat = place.get("location", {}).get("latitude")
                 dest_lng = place.get("location", {}).get("longitude")
 
-                if dest_lat and dest_lng:
-                    from math import radians, sin, cos, sqrt, atan2
-                    def haversine_distance(lat1, lon1, lat2, lon2):
-                        R = 6371
-                        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-                        dlat = lat2 - lat1
-                        dlon = lon2 - lon1
-                        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                        c = 2 * atan2(sqrt(a), sqrt(1-a))
-                        return R * c
-                    approx_distance = haversine_distance(source["lat"], source["lng"], dest_lat, dest_lng)
-                    if approx_distance > 100:
-                        logger.warning(f"Places API returned a location too far away: {dest_addr} ({approx_distance:.1f} km)")
-                        raise HTTPException(status_code=404, detail=f"Found {dest_name} at {dest_addr}, but it's too far from {source['city']}. Please clarify the destination.")
-
-            except requests.RequestException as e:
+                if approx_distance is not None and approx_distance > 100:
+                    logger.warning(f"Places API returned a location too far away: {dest_addr} ({approx_distance:.1f} km)")
+                    raise HTTPException(status_code=404, detail=f"Found {dest_name} at {dest_addr}, but it's too far from {source['city']}. Please clarify the destination.")
+
+            except httpx.HTTPError as e:
                 logger.error(f"Places API error: {str(e)}")
                 raise HTTPException(status_code=500, detail=f"Google Maps Places API error: {str(e)}")
 
             routes_url = "https://routes.googleapis.com/directions/v2:computeRoutes"
             headers = {
                 "X-Goog-Api-Key": GOOGLE_MAPS_API_KEY,
-                "X-Goog-FieldMask": "routes.distanceMeters,routes.duration,routes.polyline.encodedPolyline"
+                "X-Goog-FieldMask": "routes.distanceMeters,routes.duration,routes.polyline.encodedPolyline",
+                "Content-Type": "application/json"
             }
             payload = {
                 "origin": {"address": source_addr},
@@ -916,11 +1109,12 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
                 "units": "METRIC"
             }
             try:
-                response = requests.post(routes_url, json=payload, headers=headers, timeout=10)
-                logger.debug(f"Routes API request payload: {payload}")
-                logger.debug(f"Routes API response: {response.text}")
+                response = await maps_http_client.post(routes_url, content=orjson.dumps(payload), headers=headers)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Routes API request payload: {payload}")
+                    logger.debug(f"Routes API response: {response.text}")
                 response.raise_for_status()
-                route_data = response.json()
+                route_data = orjson.loads(response.content)
                 
                 if route_data.get("routes"):
                     distance_meters = route_data["routes"][0]["distanceMeters"]
@@ -930,8 +1124,8 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
                     duration = f"{duration_seconds // 60} mins" if duration_seconds < 3600 else f"{duration_seconds // 3600} hr {(duration_seconds % 3600) // 60} mins"
                     origin_addr = source_addr
                     
-                    map_url = f"https://www.google.com/maps/dir/?api=1&origin={urllib.parse.quote(origin_addr)}&destination={urllib.parse.quote(dest_addr)}&travelmode=driving"
-                    static_map_url = f"https://maps.googleapis.com/maps/api/staticmap?size=600x300&path=enc:{urllib.parse.quote(encoded_polyline)}&markers=label:S|color:green|{source['lat']},{source['lng']}|label:D|color:red|{dest_lat},{dest_lng}&key={GOOGLE_MAPS_API_KEY}"
+                    map_url = f"https://www.google.com/maps/dir/?api=1&origin={fast_quote(origin_addr)}&destination={fast_quote(dest_addr)}&travelmode=driving"
+                    static_map_url = f"https://maps.googleapis.com/maps/api/staticmap?size=600x300&path=enc:{fast_quote(encoded_polyline)}&markers=label:S|color:green|{source['lat']},{source['lng']}|label:D|color:red|{dest_lat},{dest_lng}&key={GOOGLE_MAPS_API_KEY}"
                     
                     map_data_temp = {
                         "type": "distance",
@@ -963,7 +1157,7 @@ async def handle_map_query(session_id: str, query_req: QueryRequest, intent_data
                     }
                 else:
                     raise HTTPException(status_code=404, detail=f"No route found to {dest_name}")
-            except requests.RequestException as e:
+            except httpx.HTTPError as e:
                 logger.error(f"Routes API error: {str(e)}")
                 raise HTTPException(status_code=500, detail=f"Google Maps Routes API error: {str(e)}")
 
@@ -985,15 +1179,15 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         await verify_websocket_session(session_id)
         await websocket.accept()
         if session_id not in websocket_connections:
-            websocket_connections[session_id] = []
-        websocket_connections[session_id].append(websocket)
+            websocket_connections[session_id] = set()
+        websocket_connections[session_id].add(websocket)
         logger.info(f"WebSocket connected for session {session_id}. Total connections: {len(websocket_connections[session_id])}")
         
         try:
             while True:
-                data = await websocket.receive_json()
+                data = await receive_ws_json(websocket)
                 if data.get("type") == "ping":
-                    await websocket.send_json({"type": "pong"})
+                    await websocket.send_text(_PONG_FRAME)
                     logger.debug(f"Received ping for session {session_id}, sent pong")
                     continue
                 
@@ -1014,13 +1208,13 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                     )
                 
         except WebSocketDisconnect:
-            websocket_connections[session_id].remove(websocket)
+            websocket_connections[session_id].discard(websocket)
             logger.info(f"WebSocket disconnected for session {session_id}. Remaining connections: {len(websocket_connections[session_id])}")
             if not websocket_connections[session_id]:
                 del websocket_connections[session_id]
         except Exception as e:
             logger.error(f"WebSocket error for session {session_id}: {str(e)}")
-            await websocket.send_json({"error": str(e)})
+            await send_ws_json(websocket, {"error": str(e)})
     except HTTPException as e:
         logger.error(f"WebSocket connection rejected for session {session_id}: {e.detail}")
         await websocket.close(code=1008, reason=e.detail)
@@ -1029,7 +1223,7 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         await websocket.close(code=1011, reason="Internal server error")
     finally:
         if session_id in websocket_connections and websocket in websocket_connections[session_id]:
-            websocket_connections[session_id].remove(websocket)
+            websocket_connections[session_id].discard(websocket)
             if not websocket_connections[session_id]:
                 del websocket_connections[session_id]
 
@@ -1048,9 +1242,51 @@ def send_stt_request(audio_filename, mp3_bytes):
         "file": (audio_filename, mp3_bytes, "audio/mp3"),
         "model_id": (None, ELEVENLABS_MODEL_ID_STT)
     }
-    response = requests.post(stt_url, headers=headers, files=files)
+    response = elevenlabs_session.post(stt_url, headers=headers, files=files)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
+
+# sha1(voice:model:text) -> mp3 bytes, so repeated/boilerplate answers skip synthesis
+_tts_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+TTS_CACHE_MAX_SIZE = 1024
+
+def _tts_cache_key(text: str) -> bytes:
+    return hashlib.sha1(f"{ELEVENLABS_VOICE_ID}:{ELEVENLABS_MODEL_ID_TTS}:{text}".encode("utf-8")).digest()
+
+def get_cached_tts(text: str) -> bytes | None:
+    key = _tts_cache_key(text)
+    audio = _tts_cache.get(key)
+    if audio is not None:
+        _tts_cache.move_to_end(key)
+        logger.debug("TTS cache hit")
+    return audio
+
+def cache_tts(text: str, audio: bytes):
+    key = _tts_cache_key(text)
+    _tts_cache[key] = audio
+    _tts_cache.move_to_end(key)
+    if len(_tts_cache) > TTS_CACHE_MAX_SIZE:
+        _tts_cache.popitem(last=False)
+
+def send_tts_request(text: str) -> requests.Response:
+    tts_headers = {
+        "Accept": "audio/mpeg",
+        "Content-Type": "application/json",
+        "xi-api-key": ELEVENLABS_API_KEY
+    }
+    tts_data = {
+        "text": text,
+        "model_id": ELEVENLABS_MODEL_ID_TTS,
+        "voice_settings": {
+            "stability": 0.5,
+            "similarity_boost": 0.5
+        }
+    }
+    return elevenlabs_session.post(
+        f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}",
+        json=tts_data,
+        headers=tts_headers
+    )
 
 async def speech_to_text(audio_bytes: bytes) -> str:
     try:
@@ -1060,7 +1296,7 @@ async def speech_to_text(audio_bytes: bytes) -> str:
         audio_segment.export(mp3_io, format="mp3")
         mp3_io.seek(0)
         
-        response_json = send_stt_request("recording.mp3", mp3_io.getvalue())
+        response_json = await asyncio.to_thread(send_stt_request, "recording.mp3", mp3_io.getvalue())
         transcription = response_json.get("text", "")
         if not transcription:
             logger.warning("No transcription generated from audio")
@@ -1087,8 +1323,7 @@ async def generate_fallback_response(query: str):
 
 async def process_query(context, query: str, role: str, intent_data: dict = None):
     try:
-        agent_instance = Agent()
-        response_data = await agent_instance.process_query(context, query, role, intent_data)
+        response_data = await agent.process_query(context, query, role, intent_data)
         return response_data
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
@@ -1096,26 +1331,21 @@ async def process_query(context, query: str, role: str, intent_data: dict = None
 
 async def persist_message(session_id: str, query: str, response: str, role: str, audio_base64: str = None, map_data: dict = None, media_data: dict = None):
     try:
-        session = await context_manager.get_session(session_id)
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        history = session.get("chat_history", [])
-        history.append({
+        ts = time.time()
+        entry = {
             "role": role,
             "query": query,
             "response": response,
-            "timestamp": int(datetime.now().timestamp()),
+            "timestamp": int(ts),
             "audio_base64": audio_base64,
             "map_data": map_data,
             "media_data": media_data
-        })
+        }
         
-        collection_name = f"sessions_{session_id}"
-        await context_manager.db[collection_name].update_one(
-            {"session_id": session_id},
-            {"$set": {"chat_history": history[-10:], "updated_at": time.time()}}
-        )
+        try:
+            await context_manager.append_history(session_id, [entry])
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Session not found")
         logger.info(f"Persisted message for session {session_id}")
     except Exception as e:
         logger.error(f"Error persisting message for session {session_id}: {str(e)}")
@@ -1127,22 +1357,22 @@ async def voice_websocket_endpoint(websocket: WebSocket, session_id: str):
         await verify_websocket_session(session_id)
         await websocket.accept()
         if session_id not in websocket_connections:
-            websocket_connections[session_id] = []
-        websocket_connections[session_id].append(websocket)
+            websocket_connections[session_id] = set()
+        websocket_connections[session_id].add(websocket)
         logger.info(f"Voice WebSocket connected for session {session_id}. Total connections: {len(websocket_connections[session_id])}")
 
         try:
             while True:
-                data = await websocket.receive_json()
+                data = await receive_ws_json(websocket)
                 if data.get("type") == "ping":
-                    await websocket.send_json({"type": "pong"})
+                    await websocket.send_text(_PONG_FRAME)
                     logger.debug(f"Received ping for session {session_id}, sent pong")
                     continue
 
                 audio_data = data.get("audio_data")
                 if not audio_data:
                     logger.error(f"No audio data provided for session {session_id}")
-                    await websocket.send_json({"error": "No audio data provided"})
+                    await send_ws_json(websocket, {"error": "No audio data provided"})
                     continue
 
                 try:
@@ -1151,7 +1381,7 @@ async def voice_websocket_endpoint(websocket: WebSocket, session_id: str):
                     transcription = await speech_to_text(audio_bytes)
                     if not transcription:
                         logger.warning(f"No transcription generated for session {session_id}")
-                        await websocket.send_json({"error": "No transcription generated from audio"})
+                        await send_ws_json(websocket, {"error": "No transcription generated from audio"})
                         continue
                     logger.debug(f"Transcribed audio for session {session_id}: {transcription}")
 
@@ -1162,32 +1392,20 @@ async def voice_websocket_endpoint(websocket: WebSocket, session_id: str):
                         role="candidate"
                     )
 
-                    # Generate TTS response
-                    tts_headers = {
-                        "Accept": "audio/mpeg",
-                        "Content-Type": "application/json",
-                        "xi-api-key": ELEVENLABS_API_KEY
-                    }
-                    tts_data = {
-                        "text": response,
-                        "model_id": ELEVENLABS_MODEL_ID_TTS,
-                        "voice_settings": {
-                            "stability": 0.5,
-                            "similarity_boost": 0.5
-                        }
-                    }
-                    tts_response = requests.post(
-                        f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}",
-                        json=tts_data,
-                        headers=tts_headers
-                    )
-                    if tts_response.status_code != 200:
-                        logger.error(f"ElevenLabs TTS API error: {tts_response.text}")
-                        await websocket.send_json({"error": f"Text-to-speech API error: {tts_response.text}"})
-                        continue
-
-                    audio_base64 = base64.b64encode(tts_response.content).decode("utf-8")
+                    # Generate TTS response off the event loop
+                    audio_bytes = get_cached_tts(response)
+                    if audio_bytes is None:
+                        tts_response = await asyncio.to_thread(send_tts_request, response)
+                        if tts_response.status_code != 200:
+                            logger.error(f"ElevenLabs TTS API error: {tts_response.text}")
+                            await send_ws_json(websocket, {"error": f"Text-to-speech API error: {tts_response.text}"})
+                            continue
+                        audio_bytes = tts_response.content
+                        cache_tts(response, audio_bytes)
+
+                    audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
                     
+                    ts = int(time.time())
                     response_message = {
                         "type": "response",
                         "role": "assistant",
@@ -1195,9 +1413,9 @@ async def voice_websocket_endpoint(websocket: WebSocket, session_id: str):
                         "audio_base64": audio_base64,
                         "map_data": None,
                         "media_data": media_data,
-                        "timestamp": int(datetime.now().timestamp())
+                        "timestamp": ts
                     }
-                    await websocket.send_json(response_message)
+                    await send_ws_json(websocket, response_message)
                     logger.debug(f"Sent voice response for session {session_id}")
 
                     # Persist the message
@@ -1212,37 +1430,28 @@ async def voice_websocket_endpoint(websocket: WebSocket, session_id: str):
                     )
 
                     # Broadcast to all WebSocket connections
-                    if session_id in websocket_connections:
-                        for conn in websocket_connections[session_id]:
-                            try:
-                                if conn != websocket:
-                                    await conn.send_json({
-                                        "role": "candidate",
-                                        "content": transcription,
-                                        "timestamp": int(datetime.now().timestamp()),
-                                        "type": "query"
-                                    })
-                                    await conn.send_json(response_message)
-                                    logger.debug(f"Broadcasted voice query and response to WebSocket for session {session_id}")
-                            except Exception as e:
-                                logger.error(f"WebSocket broadcast failed for session {session_id}: {str(e)}")
-                                websocket_connections[session_id].remove(conn)
+                    await broadcast(session_id, {
+                        "role": "candidate",
+                        "content": transcription,
+                        "timestamp": ts,
+                        "type": "query"
+                    }, response_message, exclude=websocket)
 
                 except ValueError as e:
                     logger.error(f"Invalid audio data for session {session_id}: {str(e)}")
-                    await websocket.send_json({"error": "Invalid audio data format"})
+                    await send_ws_json(websocket, {"error": "Invalid audio data format"})
                 except Exception as e:
                     logger.error(f"Error processing voice input for session {session_id}: {str(e)}")
-                    await websocket.send_json({"error": f"Failed to process voice input: {str(e)}"})
+                    await send_ws_json(websocket, {"error": f"Failed to process voice input: {str(e)}"})
             
         except WebSocketDisconnect:
             logger.info(f"Voice WebSocket disconnected for session {session_id}. Remaining connections: {len(websocket_connections.get(session_id, [])) - 1}")
-            websocket_connections[session_id].remove(websocket)
+            websocket_connections[session_id].discard(websocket)
             if not websocket_connections[session_id]:
                 del websocket_connections[session_id]
         except Exception as e:
             logger.error(f"WebSocket error for session {session_id}: {str(e)}")
-            await websocket.send_json({"error": str(e)})
+            await send_ws_json(websocket, {"error": str(e)})
     except HTTPException as e:
         logger.error(f"Voice WebSocket connection rejected for session {session_id}: {e.detail}")
         await websocket.close(code=1008, reason=e.detail)
@@ -1251,7 +1460,7 @@ async def voice_websocket_endpoint(websocket: WebSocket, session_id: str):
         await websocket.close(code=1011, reason="Internal server error")
     finally:
         if session_id in websocket_connections and websocket in websocket_connections[session_id]:
-            websocket_connections[session_id].remove(websocket)
+            websocket_connections[session_id].discard(websocket)
             if not websocket_connections[session_id]:
                 del websocket_connections[session_id]
             logger.info(f"Voice WebSocket connection closed for session {session_id}. Remaining connections: {len(websocket_connections.get(session_id, []))}")
@@ -1263,7 +1472,7 @@ async def process_voice(session_id: str, audio: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Invalid session_id format. Must be a valid UUID.")
         
         logger.info(f"Processing voice input for session {session_id}")
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         audio_content = await audio.read()
         if not audio_content:
             logger.error(f"No audio content received for session {session_id}")
@@ -1283,7 +1492,8 @@ async def process_voice(session_id: str, audio: UploadFile = File(...)):
             "file": ("recording.wav", wav_io, "audio/wav"),
             "model_id": (None, ELEVENLABS_MODEL_ID_STT)
         }
-        response = requests.post(
+        response = await asyncio.to_thread(
+            elevenlabs_session.post,
             "https://api.elevenlabs.io/v1/speech-to-text",
             headers=headers,
             files=files
@@ -1294,7 +1504,7 @@ async def process_voice(session_id: str, audio: UploadFile = File(...)):
                 raise HTTPException(status_code=429, detail="The speech-to-text service is currently busy. Please try again later.")
             raise HTTPException(status_code=500, detail=f"Speech-to-text API error: {response.text}")
         
-        transcription = response.json().get("text")
+        transcription = orjson.loads(response.content).get("text")
         if not transcription:
             logger.warning(f"No transcription received for session {session_id}")
             raise HTTPException(status_code=400, detail="No transcription could be generated from the audio")
@@ -1303,55 +1513,36 @@ async def process_voice(session_id: str, audio: UploadFile = File(...)):
         
         response, media_data, history = await context_manager.process_query(session_id, transcription, "candidate")
         
-        tts_headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": ELEVENLABS_API_KEY
-        }
-        tts_data = {
-            "text": response,
-            "model_id": ELEVENLABS_MODEL_ID_TTS,
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.5
-            }
-        }
-        tts_response = requests.post(
-            f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}",
-            json=tts_data,
-            headers=tts_headers
-        )
-        if tts_response.status_code != 200:
-            logger.error(f"ElevenLabs TTS API error: {tts_response.text}")
-            raise HTTPException(status_code=500, detail=f"Text-to-speech API error: {tts_response.text}")
+        audio_bytes = get_cached_tts(response)
+        if audio_bytes is None:
+            tts_response = await asyncio.to_thread(send_tts_request, response)
+            if tts_response.status_code != 200:
+                logger.error(f"ElevenLabs TTS API error: {tts_response.text}")
+                raise HTTPException(status_code=500, detail=f"Text-to-speech API error: {tts_response.text}")
+            audio_bytes = tts_response.content
+            cache_tts(response, audio_bytes)
         
-        audio_base64 = base64.b64encode(tts_response.content).decode("utf-8")
+        audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
         logger.info(f"Generated audio response for session {session_id}")
         
-        if session_id in websocket_connections:
-            for ws in websocket_connections[session_id]:
-                try:
-                    await ws.send_json({
-                        "role": "candidate",
-                        "content": transcription,
-                        "timestamp": time.time(),
-                        "type": "query"
-                    })
-                    await ws.send_json({
-                        "role": "assistant",
-                        "content": response,
-                        "timestamp": time.time(),
-                        "audio_base64": audio_base64,
-                        "media_data": media_data,
-                        "type": "response"
-                    })
-                    logger.debug(f"Sent voice response via WebSocket for session {session_id}")
-                except Exception as e:
-                    logger.error(f"WebSocket send failed for session {session_id}: {str(e)}")
-                    websocket_connections[session_id].remove(ws)
+        ts = time.time()
+        await broadcast(session_id, {
+            "role": "candidate",
+            "content": transcription,
+            "timestamp": ts,
+            "type": "query"
+        }, {
+            "role": "assistant",
+            "content": response,
+            "timestamp": ts,
+            "audio_base64": audio_base64,
+            "media_data": media_data,
+            "type": "response"
+        })
         
-        logger.info(f"Voice processing time: {time.time() - start_time:.2f} seconds")
-        return JSONResponse(content={
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Voice processing time: %.2f ms", (time.perf_counter_ns() - start_time) / 1e6)
+        return ORJSONResponse(content={
             "response": response,
             "audio_base64": audio_base64,
             "media_data": media_data
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import Agent
+
+
+class FailingCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        raise RuntimeError("LLM unavailable")
+
+
+class EchoCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        content = f"corrected #{self.calls}"
+        message = type("Message", (), {"content": content})()
+        return type("Response", (), {"choices": [type("Choice", (), {"message": message})()]})()
+
+
+class FakeClient:
+    def __init__(self, completions):
+        self.chat = type("Chat", (), {"completions": completions})()
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    return Agent()
+
+
+def test_fuzzy_correct_fixes_misspelled_location(agent):
+    assert agent._fuzzy_correct("hyderbad office") == "hyderabad office"
+    assert agent._fuzzy_correct("resturant neraby bengluru") == "restaurant nearby bengaluru"
+
+
+def test_fuzzy_correct_leaves_correct_words_alone(agent):
+    assert agent._fuzzy_correct("pgs nearby the offices") == "pgs nearby the offices"
+    assert agent._fuzzy_correct("what is the linear algebra round") == "what is the linear algebra round"
+
+
+def test_correct_query_does_not_skip_llm_for_misspelled_location(agent):
+    completions = FailingCompletions()
+    agent.client = FakeClient(completions)
+    corrected = asyncio.run(agent.correct_query("hyderbad office", [], "candidate"))
+    assert completions.calls == 1
+    # Falls back to the local fuzzy correction when the LLM call fails
+    assert corrected == "hyderabad office"
+
+
+def test_correction_cache_is_scoped_to_conversation_history(agent):
+    completions = EchoCompletions()
+    agent.client = FakeClient(completions)
+    dallas = [{"role": "candidate", "query": "where is the dallas office", "response": "Dallas, TX"}]
+    noida = [{"role": "candidate", "query": "where is the noida office", "response": "Noida, Uttar Pradesh"}]
+
+    async def run():
+        first = await agent.correct_query("what about pg there", dallas, "candidate")
+        again = await agent.correct_query("what about pg there", dallas, "candidate")
+        other = await agent.correct_query("what about pg there", noida, "candidate")
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first == again
+    assert other != first
+    assert completions.calls == 2
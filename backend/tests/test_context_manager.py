@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the import from loading the real MiniLM model
+with mock.patch("sentence_transformers.SentenceTransformer"):
+    from context_manager import ContextManager
+
+
+class FakeCollection:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one(self, query, projection=None):
+        return self.doc
+
+
+class FakeQdrant:
+    def __init__(self):
+        self.points = {}
+
+    async def collection_exists(self, collection_name):
+        return True
+
+    async def upsert(self, collection_name, points, wait=True):
+        self.points.setdefault(collection_name, []).extend(points)
+
+    async def query_points(self, collection_name, query, query_filter=None, **kwargs):
+        def matches(point):
+            return all(
+                point.payload.get(cond.key) == cond.match.value
+                for cond in query_filter.must
+                if getattr(cond, "match", None) is not None
+            )
+        return SimpleNamespace(points=[p for p in self.points.get(collection_name, []) if matches(p)][:1])
+
+
+class FakeAgent:
+    def __init__(self):
+        self.calls = 0
+
+    async def process_query(self, documents, history, query, role, intent_data, history_summary=None):
+        self.calls += 1
+        return f"answer for {history[0]['query']}", None
+
+
+def _session(session_id, opener):
+    return {
+        "session_id": session_id,
+        "chat_history": [{"role": "system", "query": opener, "response": ""}],
+    }
+
+
+def _make_manager(sessions):
+    agent = FakeAgent()
+    cm = ContextManager(embedder=mock.Mock(), agent=agent)
+    cm.db = {f"sessions_{sid}": FakeCollection(doc) for sid, doc in sessions.items()}
+    cm.qdrant_client = FakeQdrant()
+
+    async def fake_embed(text):
+        return np.ones(384, dtype=np.float32)
+
+    async def fake_persist(*args):
+        return None
+
+    cm._submit_embed = fake_embed
+    cm._persist_history = fake_persist
+    return cm, agent
+
+
+def test_response_cache_not_shared_across_different_histories():
+    async def run():
+        cm, agent = _make_manager({
+            "a": _session("a", "Hey Alice! ASK HR is here to assist you with your queries along the way."),
+            "b": _session("b", "Hey Bob! ASK HR is here to assist you with your queries along the way."),
+        })
+        first, _, _ = await cm.process_query("a", "What are the office hours?", "candidate", {"intent": "general"})
+        await cm.drain_background_tasks()
+        second, _, _ = await cm.process_query("b", "What are the office hours?", "candidate", {"intent": "general"})
+        return first, second, agent.calls
+
+    first, second, calls = asyncio.run(run())
+    assert calls == 2
+    assert "Alice" in first
+    assert "Bob" in second
+
+
+def test_response_cache_hit_for_identical_history():
+    async def run():
+        opener = "Hey Alice! ASK HR is here to assist you with your queries along the way."
+        cm, agent = _make_manager({"a": _session("a", opener), "c": _session("c", opener)})
+        first, _, _ = await cm.process_query("a", "What are the office hours?", "candidate", {"intent": "general"})
+        await cm.drain_background_tasks()
+        second, _, _ = await cm.process_query("c", "What are the office hours?", "candidate", {"intent": "general"})
+        return first, second, agent.calls
+
+    first, second, calls = asyncio.run(run())
+    assert calls == 1
+    assert first == second